@@ -11,13 +11,24 @@ import numpy as np
 import pyodbc
 import db_config
 from sqlalchemy import create_engine, text
-import requests
+from trend_stats import TrendStatsEngine, window_signals
+from tick_cache import TickCache, read_columns, read_bars, price_columns
+from market_metadata import metadata_client
 pd.set_option('display.max_rows', None)
 pd.set_option('display.max_columns', None)
 pd.set_option('display.width', 1000)
 
 # logger = config.setup_logger('TrendUpload')
 
+# tick table -> its bid/ask columns, joined on (coin, timestamp)
+tick_tables = {
+    'exchange_dataV2': ('hyperliquid_bid1', 'hyperliquid_ask1'),
+    'exchange_data_spot': ('bybit_bid1', 'bybit_ask1'),
+}
+uploaders = {}  # kept across scheduled runs so the incremental window survives
+trends_loop = None  # one loop for every scheduled run, so the metadata client keeps its pooled session
+
+
 
 class TrendsRedisUpload:
     def __init__(
@@ -25,7 +36,17 @@ class TrendsRedisUpload:
             connection_string,
             redis_host='localhost',
             redis_port=6379,
-            redis_db=0
+            redis_db=0,
+            incremental=True,
+            window_days=14,
+            window_rows=150000,
+            pending_grace=timedelta(minutes=5),
+            chunk_size=50000,
+            online_stats=True,
+            stats_snapshot_path='trend_stats.json',
+            signal_windows=(15, 144, 1440, '1h', '4h', '24h'),
+            tick_cache_path=None,
+            bar_minutes=None
     ):
         self.CONNECTION_STRING = connection_string
         self.redis_pool = redis.ConnectionPool(
@@ -33,16 +54,163 @@ class TrendsRedisUpload:
             port=redis_port,
             db=redis_db
         )
-    async def read_data_batch(self, batch_size=10000):
+        self.engine = None
+        self.published = None  # coin -> JSON last written to trend_data
+        self.published_version = None
+        self.upload_attempts = 3  # WATCH conflicts on trend_data_version before giving up for this cycle
+        # incremental fetch: the joined window stays resident, each cycle only pulls ids above the watermarks
+        self.incremental = incremental
+        self.window_days = window_days
+        self.window_rows = window_rows  # per table, the TOP N of the full query
+        self.chunk_size = chunk_size  # rows per fetch from the server-side cursor
+        self.watermarks = {table: None for table in tick_tables}  # table -> highest id fetched
+        self.pending = {table: None for table in tick_tables}  # rows whose other-venue partner has not arrived yet
+        # a pending row is given up once the other table's newest timestamp is this far past it
+        self.pending_grace = pending_grace
+        self.latest = {table: None for table in tick_tables}  # table -> newest timestamp fetched
+        self.window = None
+        self.tick_cache_path = tick_cache_path  # local day/coin partitions the first window is loaded from
+        self.tick_cache = None
+        # bar mode: the database aggregates bar_minutes bars per coin and the stats run on those instead of ticks
+        self.bar_minutes = bar_minutes
+        self.bars = None
+        # per-coin rolling/EWM state updated with new rows only, instead of calculate_ma_range over the full window
+        # extra windows (rows, or time like '4h') for the ma/sd/z/pct signals added to trend_data
+        self.signal_windows = signal_windows
+        self.stats_engine = None
+        if online_stats:
+            # rows newer than pending_grace may still be joined with an earlier late partner
+            self.stats_engine = TrendStatsEngine(window_m=144, window_l=15, snapshot_path=stats_snapshot_path,
+                                                 settle=pending_grace, source=f'bars{bar_minutes}' if bar_minutes else 'ticks')
+            if self.stats_engine.load():
+                print(f"Restored trend stats for {len(self.stats_engine.coins)} coins from {stats_snapshot_path}")
+
+    def fetch_table(self, conn, table):
+        '''
+        New rows of one tick table, oldest first: the last window_rows rows on the first call,
+        afterwards everything above the table's watermark (capped at window_rows).
+        '''
+        bid, ask = tick_tables[table]
+        watermark = self.watermarks[table]
+        columns = [f'{table}_id', 'coin', 'timestamp', bid, ask]
+        if watermark is None:
+            query = text(f"SELECT TOP {self.window_rows} id, coin, timestamp, {bid}, {ask} FROM {table} ORDER BY id DESC")
+            rows = read_columns(conn, query, columns, chunk_size=self.chunk_size, expected_rows=self.window_rows)
+        else:
+            query = text(f"SELECT TOP {self.window_rows} id, coin, timestamp, {bid}, {ask} FROM {table} WHERE id > :watermark ORDER BY id")
+            rows = read_columns(conn, query, columns, {"watermark": watermark}, chunk_size=self.chunk_size)
+        return rows.sort_values(f'{table}_id', ignore_index=True)
+
+    def load_from_cache(self):
+        '''
+        First window from the local tick cache: only days not cached yet (and the current one)
+        are pulled from SQL, by time range. The watermarks continue from the cached ids.
+        '''
+        if self.tick_cache is None:
+            self.tick_cache = TickCache(self.tick_cache_path, self.engine, chunk_size=self.chunk_size)
+        now = datetime.now()
+        window = self.tick_cache.load(now - timedelta(days=self.window_days), now + timedelta(minutes=1))
+        for table in tick_tables:
+            self.watermarks[table] = int(window[f'{table}_id'].max()) if len(window) else None
+            self.pending[table] = None
+        window = window.sort_values(['timestamp', 'exchange_dataV2_id'], ignore_index=True, kind='stable')
+        if self.watermarks['exchange_dataV2'] is not None:
+            window = window[window['exchange_dataV2_id'] > self.watermarks['exchange_dataV2'] - self.window_rows]
+        self.window = window.reset_index(drop=True)
+        print(f"Loaded {len(self.window)} rows from the tick cache ({self.tick_cache.fetched_days} days fetched), "
+              f"watermarks {self.watermarks}")
+        return self.window[['coin', 'timestamp', 'hyperliquid_bid1', 'hyperliquid_ask1', 'bybit_bid1', 'bybit_ask1']].copy()
+
+    def fetch_bars(self, conn):
         '''
-        Pulls the top 300k rows using pyodbc
+        Bar mode window: first/last/min/max bars aggregated on the server (see tick_cache.bar_query)
+        for the last window_days, kept between cycles. Each cycle re-reads from the start of the
+        newest bar, which was still filling, replaces those bars and evicts expired ones. Only
+        closed bars are handed on, each price set to the bar's last value, so the spreads, stats
+        and windows downstream count bars instead of ticks.
+        '''
+        now = datetime.now()
+        cutoff = now - timedelta(days=self.window_days)
+        start = cutoff if self.bars is None or self.bars.empty else self.bars['timestamp'].max().to_pydatetime()
+        bars = read_bars(conn, start, now, self.bar_minutes, self.chunk_size)
+        fetched = len(bars)
+        if self.bars is not None:
+            kept = self.bars[(self.bars['timestamp'] < start) & (self.bars['timestamp'] >= cutoff)]
+            bars = pd.concat([kept, bars], ignore_index=True)
+            bars['coin'] = bars['coin'].astype('category')
+        self.bars = bars
+        closed = bars[bars['timestamp'] + pd.Timedelta(minutes=self.bar_minutes) <= now]
+        df = pd.DataFrame({'coin': closed['coin'], 'timestamp': closed['timestamp']})
+        for column in price_columns:
+            df[column] = closed[f'{column}_last']
+        print(f"Bar fetch: {fetched} bars from {start}, window {len(bars)} bars, {len(df)} closed")
+        return df.reset_index(drop=True)
+
+    def fetch_incremental(self, conn):
+        '''
+        Joined two-week window kept between cycles. Only rows with an id above each table's
+        watermark are fetched; they are joined on (coin, timestamp) together with the rows still
+        waiting for their partner from the other table, appended, and rows older than
+        window_days (or beyond the last window_rows ids of exchange_dataV2) are evicted.
+        Unmatched rows wait until the other table's newest timestamp is pending_grace past
+        them, then they are dropped (a coin listed on one venue only never matches).
+        If a table returns a full window_rows of new rows the gap is too big and the window is
+        rebuilt from scratch.
+        '''
+        if self.window is None and self.tick_cache_path:
+            return self.load_from_cache()
+        new_rows = {table: self.fetch_table(conn, table) for table in tick_tables}
+        if self.window is not None and any(len(rows) >= self.window_rows for rows in new_rows.values()):
+            print("Incremental fetch fell behind, reloading the window")
+            self.watermarks = {table: None for table in tick_tables}
+            self.pending = {table: None for table in tick_tables}
+            self.window = None
+            new_rows = {table: self.fetch_table(conn, table) for table in tick_tables}
+        for table, rows in new_rows.items():
+            if not rows.empty:
+                self.watermarks[table] = int(rows[f'{table}_id'].iloc[-1])
+                latest = rows['timestamp'].max()
+                if self.latest[table] is None or latest > self.latest[table]:
+                    self.latest[table] = latest
+            if self.pending[table] is not None:
+                new_rows[table] = pd.concat([self.pending[table], rows], ignore_index=True)
+        hyperliquid, bybit = new_rows['exchange_dataV2'], new_rows['exchange_data_spot']
+        key = ['coin', 'timestamp']
+        matched = hyperliquid.merge(bybit, on=key)
+        matched_keys = pd.MultiIndex.from_frame(matched[key])
+        cutoff = datetime.now() - timedelta(days=self.window_days)
+        for table, rows in new_rows.items():
+            rows = rows[~pd.MultiIndex.from_frame(rows[key]).isin(matched_keys)]
+            other = next(name for name in tick_tables if name != table)
+            expiry = pd.Timestamp(cutoff)
+            if self.latest[other] is not None:
+                expiry = max(expiry, self.latest[other] - self.pending_grace)
+            self.pending[table] = rows[rows['timestamp'] >= expiry]
+        window = matched if self.window is None else pd.concat([self.window, matched], ignore_index=True)
+        window = window[window['timestamp'] >= cutoff]
+        if self.watermarks['exchange_dataV2'] is not None:
+            window = window[window['exchange_dataV2_id'] > self.watermarks['exchange_dataV2'] - self.window_rows]
+        window = window.sort_values(['timestamp', 'exchange_dataV2_id'], ignore_index=True, kind='stable')
+        # frames read at different times carry different coin categories, merge/concat fall back to object
+        window['coin'] = window['coin'].astype('category')
+        self.window = window
+        print(f"Incremental fetch: {len(hyperliquid)} + {len(bybit)} new rows, {len(matched)} joined, "
+              f"{sum(len(rows) for rows in self.pending.values())} pending, window {len(self.window)} rows, "
+              f"watermarks {self.watermarks}")
+        return self.window[['coin', 'timestamp', 'hyperliquid_bid1', 'hyperliquid_ask1', 'bybit_bid1', 'bybit_ask1']].copy()
+    async def read_data(self):
+        '''
+        Pulls the two-week window (streamed into columns, see read_columns) and the Hyperliquid
+        metadata, computes the scores and returns the frame
         '''
         self.scores = dict()
         self.hyperliquid_funding_rate = dict()  # { symbol: funding }
         self.hyperliquid_open_interest = dict()  # {symbol: open interest}
         self.hyperliquid_day_volume = dict()
         self.hyperliquid_mark_price = dict()
-        engine = create_engine(self.CONNECTION_STRING)
+        if self.engine is None:
+            self.engine = create_engine(self.CONNECTION_STRING)
+        engine = self.engine
         try:
 
             # Get the maximum ID
@@ -69,13 +237,15 @@ class TrendsRedisUpload:
 
             with engine.connect() as conn:
                 print("connected to server")
-                result = conn.execute(query).fetchall()
+                if self.bar_minutes:
+                    df = self.fetch_bars(conn)
+                elif self.incremental:
+                    df = self.fetch_incremental(conn)
+                else:
+                    df = read_columns(conn, query,
+                                      ['coin', 'timestamp', 'hyperliquid_bid1', 'hyperliquid_ask1', 'bybit_bid1', 'bybit_ask1'],
+                                      chunk_size=self.chunk_size, expected_rows=two_weeks)
                 print("Get the result ")
-            # Get column names
-                df = pd.DataFrame(result,
-                                  columns=['coin', 'timestamp', 'hyperliquid_bid1', 'hyperliquid_ask1', 'bybit_bid1',
-                                           'bybit_ask1'])
-                df['timestamp'] = pd.to_datetime(df['timestamp'])
                 two_weeks_ago = datetime.now() - timedelta(days=14)
                 df = df[df['timestamp'] >= two_weeks_ago]
                 df.set_index('timestamp', inplace=True)
@@ -89,27 +259,13 @@ class TrendsRedisUpload:
                 latest = df.groupby('coin').apply(lambda x: x.index.max())
                 # print("types in dataframe:", df.dtypes)
                 # print("df within read_data_batch", df)
-                #API calls here
-                hyperliquid_url = "https://api.hyperliquid.xyz/info"
-                headers = {"Content-Type": "application/json; charset=utf-8"}
-                data = {
-                    "type": "metaAndAssetCtxs"
-                }
-                response = self.post_method(hyperliquid_url, headers, data)
-                # Yield the data in chunks
-                universe = response[0]['universe']
-                fundings = response[1]
-                # print("universe:", universe)
-                for uni, fund in zip(universe, fundings):
-                    symbol = uni["name"]
-                    fund_rate = float(fund["funding"])
-                    self.hyperliquid_funding_rate[f"{symbol}/USDT"] = fund_rate
-                    self.hyperliquid_open_interest[f"{symbol}/USDT"] = fund["openInterest"]  # USD
-                    self.hyperliquid_day_volume[f"{symbol}/USDT"] = fund["dayNtlVlm"]  # BTC
-                    self.hyperliquid_mark_price[f"{symbol}/USDT"] = fund["markPx"]
-                self.hyperliquid_day_volume = {sym: float(volume) for sym, volume in self.hyperliquid_day_volume.items()}
-                self.hyperliquid_open_interest = {sym: float(volume) * float(self.hyperliquid_mark_price[sym]) for sym, volume in
-                                             self.hyperliquid_open_interest.items()}
+                # Hyperliquid metadata through the shared pooled, cached client
+                contexts = await metadata_client.hyperliquid_asset_contexts()
+                for coin, ctx in contexts.items():
+                    self.hyperliquid_funding_rate[f"{coin}/USDT"] = ctx.funding
+                    self.hyperliquid_open_interest[f"{coin}/USDT"] = ctx.open_interest_usd  # USD
+                    self.hyperliquid_day_volume[f"{coin}/USDT"] = ctx.day_volume
+                    self.hyperliquid_mark_price[f"{coin}/USDT"] = ctx.mark_price
                 symbol = list(averages.index)
                 symbol1 = [sym for sym in symbol]
                 symbol2 = list(self.hyperliquid_funding_rate.keys())
@@ -129,11 +285,15 @@ class TrendsRedisUpload:
                 self.scores = {sym: float(num) for sym, num in scores}
                 # print("df:", df)
                 # print("scores:", scores)
-                for i in range(0, len(df), batch_size):
-                    yield df.iloc[i:i + batch_size]
+                return df
 
         finally:
             conn.close()
+
+    async def read_data_batch(self, batch_size=10000):
+        df = await self.read_data()
+        for i in range(0, len(df), batch_size):
+            yield df.iloc[i:i + batch_size]
     def find_common_elements(self, list1, list2):
     # Convert lists to sets
         set1 = set(list1)
@@ -163,7 +323,6 @@ class TrendsRedisUpload:
 
     @staticmethod
     def calculate_stats_E(group, column, window):
-        print("group:", group)
         ma = group[column].rolling(window=window).mean()
         ewvar = group[column].ewm(span=window, adjust=False).var()
         ewsd = np.sqrt(ewvar)
@@ -211,52 +370,94 @@ class TrendsRedisUpload:
         df_stats = df_stats.sort_values(by='score', ascending=False)
         df_stats.to_csv("ma_stats.csv", index=False)
         return df_stats
-    def post_method(self, url, headers, data):
-        try:
-            # Send POST request
-            resp = requests.post(url=url, headers=headers, json=data)
-
-            # Check response status codes
-            if resp.status_code == 200:
-                # Parse JSON from the response
-                response = resp.json()
-                return response
-            elif resp.status_code == 404:
-                return "Not Found."
-            else:
-                return f"Failed with status code: {resp.status_code}"
-        except requests.exceptions.RequestException as e:
-            # Return error message for connection-related exceptions
-            return f"Error during the request: {e}"
-    def upload_to_redis(self, df):
-        redis_client = redis.Redis(connection_pool=self.redis_pool)
-
-        with redis_client.pipeline() as pipe:
-            pipe.delete('trend_data')
-
-            for _, row in df.iterrows():
-                coin = row['coin']
-                row_json = row.drop('coin').to_json()
-                pipe.hset('trend_data', coin, row_json)
-
-            pipe.execute()
-
-        print(f"Uploaded {len(df)} records to Redis at {datetime.now()}")
+    def calculate_ma_range_online(self, df):
+        '''Same table as calculate_ma_range, from the stats engine fed with only the rows it has not seen'''
+        df = df.dropna()
+        new_rows = self.stats_engine.update(df)
+        if self.stats_engine.snapshot_path:
+            self.stats_engine.save()
+        df_stats = self.stats_engine.summary(list(df['coin'].unique()))
+        df_stats['score'] = df_stats['coin'].map(self.scores)
+        df_stats['hyperliquid_funding_rate'] = df_stats['coin'].map(self.hyperliquid_funding_rate)
+        df_stats['hyperliquid_open_interest'] = df_stats['coin'].map(self.hyperliquid_open_interest)
+        df_stats['hyperliquid_day_volume'] = df_stats['coin'].map(self.hyperliquid_day_volume)
+        df_stats = df_stats.sort_values(by='score', ascending=False)
+        df_stats.to_csv("ma_stats.csv", index=False)
+        print(f"Trend stats: {new_rows} new rows for {len(df_stats)} coins")
+        return df_stats
 
-        print("Verifying upload...")
-        keys = redis_client.hkeys('trend_data')
-        print(f"Number of keys in 'trend_data': {len(keys)}")
+    @staticmethod
+    def serialize_rows(df):
+        '''coin -> JSON of the rest of its row, one to_json call for the whole frame'''
+        records = df.drop(columns='coin').to_json(orient='records', lines=True).splitlines()
+        return dict(zip(df['coin'].astype(str), records))
 
-        if keys:
-            first_key = keys[0].decode('utf-8')
-            first_value = redis_client.hget('trend_data', first_key).decode('utf-8')
-            print(f"Sample record - {first_key}: {first_value}")
+    def upload_to_redis(self, df, key='trend_data'):
+        '''
+        Publishes one JSON field per coin into the `key` hash without readers ever seeing it
+        empty or half written. The first upload (and any upload after `key`_version moved
+        without us, e.g. a Redis restart or another writer) builds the hash under a staging key
+        and RENAMEs it over `key`. Afterwards only fields whose JSON changed are HSET and coins
+        that disappeared are HDELed, in one MULTI/EXEC. Every upload that changes something
+        INCRs `key`_version, so readers can cache until it moves. The version is WATCHed from
+        the GET to the EXEC; if another writer moves it in between, the upload is retried.
+        '''
+        redis_client = redis.Redis(connection_pool=self.redis_pool)
+        fields = self.serialize_rows(df)
+        version_key = f'{key}_version'
+        with redis_client.pipeline(transaction=True) as pipe:
+            for attempt in range(self.upload_attempts):
+                try:
+                    # EXEC fails if anyone else moves the version between this GET and it
+                    pipe.watch(version_key)
+                    version = pipe.get(version_key)
+                    rebuild = self.published is None or version is None or int(version) != self.published_version
+                    if rebuild:
+                        changed, removed = fields, []
+                    else:
+                        changed = {coin: value for coin, value in fields.items() if self.published.get(coin) != value}
+                        removed = [coin for coin in self.published if coin not in fields]
+                        if not changed and not removed:
+                            print(f"No changes in {len(fields)} records at {datetime.now()}, version {self.published_version}")
+                            return
+                    pipe.multi()
+                    if rebuild:
+                        staging = f'{key}:staging'
+                        pipe.delete(staging)
+                        if fields:
+                            pipe.hset(staging, mapping=fields)
+                            pipe.rename(staging, key)
+                        else:
+                            pipe.delete(key)
+                    else:
+                        if changed:
+                            pipe.hset(key, mapping=changed)
+                        if removed:
+                            pipe.hdel(key, *removed)
+                    pipe.incr(version_key)
+                    self.published_version = pipe.execute()[-1]
+                    break
+                except redis.WatchError:
+                    # the retry sees the moved version and rebuilds
+                    print(f"{version_key} changed during the upload, retrying")
+            else:
+                self.published = None
+                print(f"Gave up uploading to Redis after {self.upload_attempts} attempts at {datetime.now()}")
+                return
+        self.published = fields
+        print(f"Uploaded {len(changed)} of {len(fields)} records ({len(removed)} removed, "
+              f"{'rebuilt' if rebuild else 'diff'}) to Redis at {datetime.now()}, version {self.published_version}")
 
     async def process_and_upload(self):
-        all_data = pd.concat([chunk async for chunk in self.read_data_batch() if not chunk.empty])
+        all_data = await self.read_data()
         if not all_data.empty:
             all_data = self.calculate_spread(all_data)
-            ma_range_df = await self.calculate_ma_range(all_data, window_m=144, window_l=15)
+            if self.stats_engine is not None:
+                ma_range_df = self.calculate_ma_range_online(all_data)
+            else:
+                ma_range_df = await self.calculate_ma_range(all_data, window_m=144, window_l=15)
+            if self.signal_windows:
+                ma_range_df = ma_range_df.merge(window_signals(all_data, self.signal_windows), on='coin', how='left')
             print(ma_range_df)
             self.upload_to_redis(ma_range_df)
             print(f"Uploaded to Redis at {datetime.now()}")
@@ -275,19 +476,36 @@ async def update_trends_redis(
         redis_port=6379,
         redis_db=0
 ):
-    uploader = TrendsRedisUpload(connection_string, redis_host, redis_port, redis_db)
-    await uploader.process_and_upload()
+    key = (connection_string, redis_host, redis_port, redis_db)
+    if key not in uploaders:
+        uploaders[key] = TrendsRedisUpload(connection_string, redis_host, redis_port, redis_db)
+    await uploaders[key].process_and_upload()
 
 
 def update_trends():
+    global trends_loop
     try:
         connection_string = db_config.connection_string_dash
-        asyncio.run(update_trends_redis(connection_string))
+        if trends_loop is None:
+            trends_loop = asyncio.new_event_loop()
+        trends_loop.run_until_complete(update_trends_redis(connection_string))
     except Exception as e:
         print(f"Error in update_trends: {e}")
         print(traceback.format_exc())
 
 
+def close_trends_loop():
+    global trends_loop
+    if trends_loop is None:
+        return
+    try:
+        trends_loop.run_until_complete(metadata_client.close())
+    except Exception as e:
+        print(f"Error closing metadata client: {e}")
+    trends_loop.close()
+    trends_loop = None
+
+
 def run_schedule():
     while True:
         try:
@@ -334,4 +552,5 @@ if __name__ == "__main__":
         logger.critical(f"Fatal error in main: {e}")
         logger.critical(traceback.format_exc())
     finally:
+        close_trends_loop()
         logger.info("Script has exited. This message should not appear unless intentionally stopped.")
\ No newline at end of file
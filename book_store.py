@@ -0,0 +1,203 @@
+import time
+import numpy as np
+
+HYPERLIQUID, BYBIT = 0, 1
+BID, ASK = 0, 1
+
+
+class BookStore:
+    '''
+    Structure-of-arrays copy of the top `levels` of every symbol's books: prices and sizes
+    live in preallocated (capacity, venue, side, level) arrays, padded with zeros past each
+    side's level count. Rows are refreshed from the OrderBooks only when a side's version
+    changed, and compute() resolves best prices, spreads and the whole impact ladder for
+    any set of rows in one vectorized pass. Depth beyond `levels` is not seen, so size it
+    from the deepest subscribed book; covers() tells whether a pair of books fits.
+    '''
+    def __init__(self, levels=50, capacity=256):
+        self.levels = levels
+        self.capacity = 0
+        self.prices = np.zeros((0, 2, 2, levels))
+        self.sizes = np.zeros((0, 2, 2, levels))
+        self.counts = np.zeros((0, 2, 2), dtype=np.int64)
+        self.times = np.zeros((0, 2), dtype=np.int64)
+        self.rows = {}  # symbol -> row
+        self.free = []
+        self.loaded = {}  # (row, venue, side) -> (book side, version) last copied
+        self._grow(capacity)
+
+    def _grow(self, capacity):
+        extra = capacity - self.capacity
+        self.prices = np.concatenate([self.prices, np.zeros((extra, 2, 2, self.levels))])
+        self.sizes = np.concatenate([self.sizes, np.zeros((extra, 2, 2, self.levels))])
+        self.counts = np.concatenate([self.counts, np.zeros((extra, 2, 2), dtype=np.int64)])
+        self.times = np.concatenate([self.times, np.zeros((extra, 2), dtype=np.int64)])
+        self.free.extend(range(capacity - 1, self.capacity - 1, -1))
+        self.capacity = capacity
+
+    def row(self, symbol):
+        row = self.rows.get(symbol)
+        if row is None:
+            if not self.free:
+                self._grow(self.capacity * 2)
+            row = self.rows[symbol] = self.free.pop()
+        return row
+
+    def remove(self, symbol):
+        row = self.rows.pop(symbol, None)
+        if row is not None:
+            self.counts[row] = 0
+            for key in [key for key in self.loaded if key[0] == row]:
+                del self.loaded[key]
+            self.free.append(row)
+
+    def _load_side(self, row, venue, side, book_side):
+        key = (row, venue, side)
+        if self.loaded.get(key) == (book_side, book_side.version):
+            return
+        levels = book_side.top_n(self.levels)
+        n = len(levels)
+        if n:
+            self.prices[row, venue, side, :n], self.sizes[row, venue, side, :n] = zip(*levels)
+        self.prices[row, venue, side, n:] = 0.0
+        self.sizes[row, venue, side, n:] = 0.0
+        self.counts[row, venue, side] = n
+        self.loaded[key] = (book_side, book_side.version)
+
+    def covers(self, hyperliquid_book, bybit_book):
+        '''True when no side of the two books holds more than `levels` levels.'''
+        return all(len(side) <= self.levels for book in (hyperliquid_book, bybit_book) for side in (book.bids, book.asks))
+
+    def load(self, symbol, hyperliquid_book, bybit_book):
+        row = self.row(symbol)
+        for venue, book in ((HYPERLIQUID, hyperliquid_book), (BYBIT, bybit_book)):
+            self._load_side(row, venue, BID, book.bids)
+            self._load_side(row, venue, ASK, book.asks)
+            self.times[row, venue] = book.time
+        return row
+
+    def compute(self, rows, notionals):
+        '''
+        For rows (k,) and notionals (m,) returns arrays: best 'prices' and 'sizes' (k, venue, side),
+        'entry_spread'/'exit_spread' (k,) from the best prices, 'impact' (k, venue, side, m) with
+        NaN where a side cannot fill, and 'impact_entry_spread'/'impact_exit_spread' (k, m).
+        Same arithmetic as DepthCurve.impact_prices, for every row at once.
+        '''
+        rows = np.asarray(rows, dtype=np.int64)
+        notionals = np.asarray(notionals, dtype=np.float64)
+        prices = self.prices[rows]
+        sizes = self.sizes[rows]
+        counts = self.counts[rows]
+        cum_notional = np.cumsum(prices * sizes, axis=-1)
+        cum_quantity = np.cumsum(sizes, axis=-1)
+        # first level whose accumulated notional reaches each target (searchsorted 'left')
+        idx = (cum_notional[..., None, :] < notionals[:, None]).sum(axis=-1)
+        reached = idx < counts[..., None]
+        idx = np.minimum(idx, np.maximum(counts[..., None] - 1, 0))
+        prev = np.maximum(idx - 1, 0)
+        has_prev = idx > 0
+        prev_notional = np.where(has_prev, np.take_along_axis(cum_notional, prev, axis=-1), 0.0)
+        prev_quantity = np.where(has_prev, np.take_along_axis(cum_quantity, prev, axis=-1), 0.0)
+        level_price = np.take_along_axis(prices, idx, axis=-1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            remaining_quantity = (notionals - prev_notional) / level_price
+            impact = np.where(reached, notionals / (prev_quantity + remaining_quantity), np.nan)
+            best = np.where(counts > 0, prices[..., 0], np.nan)
+            entry_spread = np.round(100 * (best[:, HYPERLIQUID, BID] - best[:, BYBIT, ASK]) / best[:, BYBIT, ASK], 4)
+            exit_spread = np.round(100 * (best[:, HYPERLIQUID, ASK] - best[:, BYBIT, BID]) / best[:, BYBIT, BID], 4)
+            impact_entry_spread = np.round(100 * (impact[:, HYPERLIQUID, BID] - impact[:, BYBIT, ASK]) / impact[:, BYBIT, ASK], 4)
+            impact_exit_spread = np.round(100 * (impact[:, HYPERLIQUID, ASK] - impact[:, BYBIT, BID]) / impact[:, BYBIT, BID], 4)
+        return {
+            'prices': best,
+            'sizes': np.where(counts > 0, sizes[..., 0], np.nan),
+            'entry_spread': entry_spread,
+            'exit_spread': exit_spread,
+            'impact': impact,
+            'impact_entry_spread': impact_entry_spread,
+            'impact_exit_spread': impact_exit_spread,
+        }
+
+    def top_n(self, row, venue, side, n=5):
+        count = min(int(self.counts[row, venue, side]), n)
+        return list(zip(self.prices[row, venue, side, :count].tolist(), self.sizes[row, venue, side, :count].tolist()))
+
+
+def benchmark(symbol_counts=(1, 10, 50, 150, 500), levels=50, repeats=200, seed=0):
+    '''Per-symbol impact_ladder calls against one BookStore.compute pass, for growing symbol counts.'''
+    from orderbook import OrderBook
+    from impact_price import BookImpact, impact_ladder, impact_notionals
+    rng = np.random.default_rng(seed)
+    results = []
+    for count in symbol_counts:
+        store = BookStore(levels, capacity=count)
+        books = []
+        for i in range(count):
+            pair = []
+            for venue in ('hyperliquid', 'bybit'):
+                book = OrderBook(f'S{i}', venue)
+                mid = 100 + i
+                book.apply_snapshot([(mid - 0.01 * (j + 1), rng.uniform(1, 50)) for j in range(levels)],
+                                    [(mid + 0.01 * (j + 1), rng.uniform(1, 50)) for j in range(levels)], 1, 1)
+                pair.append(book)
+            books.append(pair)
+            store.load(f'S{i}', *pair)
+        impacts = [(BookImpact(hyperliquid), BookImpact(bybit)) for hyperliquid, bybit in books]
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for hyperliquid, bybit in impacts:
+                impact_ladder(hyperliquid, bybit, impact_notionals)
+        per_symbol = (time.perf_counter() - start) / repeats
+        rows = list(range(count))
+        start = time.perf_counter()
+        for _ in range(repeats):
+            store.compute(rows, impact_notionals)
+        batched = (time.perf_counter() - start) / repeats
+        results.append((count, per_symbol * 1e6, batched * 1e6))
+    return results
+
+
+def check_deep_books(depth=500, symbols=20, levels=None, seed=0):
+    '''
+    Builds `symbols` pairs of `depth`-level books thin enough that the top impact rungs need
+    most of the depth, and returns the largest difference between BookStore.compute (a store
+    of `levels`, default depth) and impact_ladder. Raises when a rung is filled on one side only.
+    '''
+    from orderbook import OrderBook
+    from impact_price import BookImpact, impact_ladder, impact_notionals
+    rng = np.random.default_rng(seed)
+    store = BookStore(levels or depth, capacity=symbols)
+    keys = ['impact_bid_price_hyperliquid', 'impact_ask_price_hyperliquid', 'impact_bid_price_bybit',
+            'impact_ask_price_bybit', 'entry_spread', 'exit_spread']
+    worst = 0.0
+    for i in range(symbols):
+        pair = []
+        for venue in ('hyperliquid', 'bybit'):
+            book = OrderBook(f'S{i}', venue)
+            mid = 100 + i
+            # about 3k USD per side in the top 50 levels, 100k needs most of 500
+            book.apply_snapshot([(mid - 0.01 * (j + 1), rng.uniform(0.2, 0.6)) for j in range(depth)],
+                                [(mid + 0.01 * (j + 1), rng.uniform(0.2, 0.6)) for j in range(depth)], 1, 1)
+            pair.append(book)
+        row = store.load(f'S{i}', *pair)
+        result = store.compute([row], impact_notionals)
+        impact = result['impact'][0]
+        batched = {notional: dict(zip(keys, [impact[HYPERLIQUID, BID, j], impact[HYPERLIQUID, ASK, j], impact[BYBIT, BID, j],
+                                             impact[BYBIT, ASK, j], result['impact_entry_spread'][0, j],
+                                             result['impact_exit_spread'][0, j]]))
+                   for j, notional in enumerate(impact_notionals)}
+        ladder = impact_ladder(BookImpact(pair[0]), BookImpact(pair[1]), impact_notionals)
+        for notional in impact_notionals:
+            for key in keys:
+                expected, value = ladder[notional][key], batched[notional][key]
+                if (expected is None) != (value != value):
+                    raise AssertionError(f"S{i} {notional} {key}: impact_ladder {expected}, BookStore {value}")
+                if expected is not None:
+                    worst = max(worst, abs(expected - value))
+    return worst
+
+
+if __name__ == "__main__":
+    print(f"deep books: max batch/symbol difference {check_deep_books():.3g}")
+    print(f"{'symbols':>8} {'per-symbol us':>14} {'batched us':>11}")
+    for count, per_symbol, batched in benchmark():
+        print(f"{count:>8} {per_symbol:>14.1f} {batched:>11.1f}")
@@ -1,8 +1,9 @@
 import asyncio
+import atexit
 import websockets
 import json
 import time
-import redis
+import redis.asyncio as redis
 import logging
 from decimal import Decimal, ROUND_HALF_UP
 from datetime import datetime, timezone
@@ -10,70 +11,114 @@ from collections import defaultdict
 import config
 import hmac
 import base64
-from pybit.unified_trading import WebSocket
+from bybit_feed import BybitConnectionManager, merge_orderbook_messages
+from handoff import ConflatingHandoff
+from decoder import decode_bybit_orderbook, decode_hyperliquid_l2book, loads as json_loads
+from hyperliquid_feed import HyperliquidSession
+from functools import partial
+from orderbook import OrderBook
+from impact_price import BookImpact, impact_ladder, impact_notionals
+from telemetry import setup_logging, TickDumper
+from redis_publisher import RedisSnapshotPublisher
+from spread_record import encode_record
+from scheduler import CoalescingScheduler
+from latency import LatencyRecorder, publish_latency, receive_stamp, serve_latency, stamp_receive
+from capture import FrameCapture, replay
+from top_of_book import TopOfBookWriter
+from universe import UniverseManager
+from book_store import BookStore
+from market_metadata import metadata_client
 
 
-#basic log info files
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s %(levelname)s:%(message)s',
-    handlers=[
-        logging.FileHandler("websocketByHyper.log"),
-        logging.StreamHandler()
-    ]
-)
+#basic log info files, written by a background thread so the feed never waits on file/console I/O
+setup_logging("websocketByHyper.log", level=logging.INFO)
+logger = logging.getLogger()
+tick_log_interval = 1.0 # seconds between text dumps of combined data per symbol
+tick_log_binary_path = None # e.g. "ticks.bin" to also record every tick in the compact binary format
+tick_dumper = TickDumper(tick_log_interval, tick_log_binary_path)
 redis_client = redis.Redis(host='localhost', port=6379, db=0)
-# bybit_ws_url = "wss://stream.bybit.com/realtime" # maybe do not need it
+redis_record_format = 'json' # 'binary' publishes spread_record.encode_record payloads to combined_data_bin_{symbol}
+redis_record_depth = 0 # levels per side embedded in binary records, 0 keeps only prices/sizes/spreads/ladder
+def make_redis_publisher(): # snapshots are buffered per symbol and written as pipelined RPUSH/LTRIM batches, process_data never waits on redis
+    if redis_record_format == 'binary':
+        return RedisSnapshotPublisher(redis_client, key_prefix='combined_data_bin_', max_len=500,
+                                      serializer=partial(encode_record, depth_levels=redis_record_depth))
+    return RedisSnapshotPublisher(redis_client, key_prefix='combined_data_', max_len=500)
+redis_publisher = make_redis_publisher()
+bybit_ws_url = None # None uses pybit's endpoint, "ws://127.0.0.1:8801/v5/public/linear" points at simulator.py
 hyperliquid_ws_url = "wss://api.hyperliquid.xyz/ws"
 hyperliquid_stream_types = ['l2Book']
 bybit_stream_types = [1, 50, 200, 500] # need to find the stream for this one the depth, use the websocket for this
+default_bybit_stream = 50 # bybit depth used when a hyperliquid update triggers processing
 symbols = ['BTC', 'SOL', 'ETH'] # for hyperliquid
 # hyperliquid_message = {
 #     "method": "subscribe",
 #     "subscription":{ "type": "l2Book", "coin": "BTC" }
 # }
 orderbook_data = list()
-latest_data = {symbol: {
-    'hyperliquid': {'bids': defaultdict(float), 'asks': defaultdict(float), 'time': 0},
-    'bybit': {
-        stream_type: {'bids': {}, 'asks': {}, 'time': None}
-        for stream_type in bybit_stream_types
-    },
-    'local_orderbook': {'bids': [], 'asks': [], 'time': None}
-} for symbol in symbols}
-last_process_time = {symbol: 0 for symbol in symbols}
+latest_data = {}
+impact_books = {} # cumulative depth arrays per book side, rebuilt lazily when the book changes
+last_process_time = {}
+def add_symbol_state(symbol): # books and impact curves for one coin on both venues
+    latest_data[symbol] = {
+        'hyperliquid': {'bids': defaultdict(float), 'asks': defaultdict(float), 'time': 0},
+        'bybit': {
+            stream_type: OrderBook(symbol, 'bybit', max_depth=stream_type)
+            for stream_type in bybit_stream_types
+        },
+        'local_orderbook': OrderBook(symbol, 'hyperliquid')
+    }
+    impact_books[symbol] = {
+        'hyperliquid': BookImpact(latest_data[symbol]['local_orderbook']),
+        'bybit': {
+            stream_type: BookImpact(latest_data[symbol]['bybit'][stream_type])
+            for stream_type in bybit_stream_types
+        }
+    }
+    last_process_time[symbol] = 0
+def remove_symbol_state(symbol): # drops a coin's books, pending computation and impact curves
+    compute_scheduler.cancel(symbol)
+    batch_pending.pop(symbol, None)
+    book_store.remove(symbol)
+    if top_of_book is not None:
+        top_of_book.remove(symbol) # frees its slot for the next symbol
+    latest_data.pop(symbol, None)
+    impact_books.pop(symbol, None)
+    last_process_time.pop(symbol, None)
+for symbol in symbols:
+    add_symbol_state(symbol)
+compute_interval = 0.025 # seconds between spread computations per symbol
+latency_recorder = LatencyRecorder() # per-stage histograms, p50/p99/p99.9 in redis 'feed_latency' and on the local endpoint
+redis_publisher.latency_recorder = latency_recorder # times every snapshot's redis write as the 'redis' stage
+latency_port = 8790 # local http endpoint for the histograms, None to disable
+compute_intervals = {} # per-symbol overrides, e.g. {'BTC': 0.01}
+compute_mode = 'symbol' # 'batch': symbols due together are computed in one vectorized pass over book_store
+book_store = BookStore(levels=max(bybit_stream_types)) # every level of the deepest subscribed books as numpy arrays, used in batch mode
+batch_pending = {} # symbol -> bybit depth queued for the next process_data_batch
+batch_handle = None
+bybit_manager = None # BybitConnectionManager holding every symbol/depth subscription
+hyperliquid_session = None # HyperliquidSession holding every coin's subscriptions
+# pybit threads and the hyperliquid session only enqueue here, feed_consumer owns every book and process_data call
+feed_handoff = ConflatingHandoff()
+capture_directory = None # e.g. "captures" to record every raw frame into gzip segments for replay (python capture.py captures/)
+def make_frame_capture():
+    capture = FrameCapture(capture_directory) if capture_directory else None
+    if capture is not None:
+        atexit.register(capture.close) # finish the open gzip segment on exit
+    return capture
+frame_capture = make_frame_capture()
+top_of_book_path = None # e.g. "/dev/shm/felix_top_of_book", latest spreads per symbol for local readers (top_of_book.TopOfBookReader)
+top_of_book = TopOfBookWriter(top_of_book_path) if top_of_book_path else None
+dynamic_universe = False # True: track every coin listed on both hyperliquid and bybit linear instead of only `symbols`
+universe_refresh_interval = 300 # seconds between listing refreshes
+universe_max_symbols = None # cap on tracked coins, None for all
 #done
 def update_local_orderbook(symbol, stream_type, new_data): #confirmed
     global latest_data
-    # local_ob = latest_data[symbol]['local_orderbook']
-    print("new_data:", new_data)
-    def update_side(side, new_levels):
-        current_levels = {price: size for price, size in latest_data[symbol]['local_orderbook'][side]}
-        for price, size in new_levels:
-            if size == 0:
-                current_levels.pop(price, None)
-            else:
-                current_levels[price] = size
-
-        sorted_levels = sorted(current_levels.items(), key=lambda x: -x[0] if side == 'bids' else x[0])
-        return sorted_levels[:5]
-
-    if stream_type == 'l2Book':
-        # Replace the entire local orderbook with books5 data
-        latest_data[symbol]['local_orderbook']['bids'] = new_data['bids']
-        latest_data[symbol]['local_orderbook']['asks'] = new_data['asks']
-    else:
-        # Update the local orderbook with new data
-        latest_data[symbol]['local_orderbook']['bids'] = update_side('bids', new_data['bids'])
-        latest_data[symbol]['local_orderbook']['asks'] = update_side('asks', new_data['asks'])
-
-    # Ensure we always have 5 levels for both bids and asks
-    while len(latest_data[symbol]['local_orderbook']['bids']) < 5:
-        latest_data[symbol]['local_orderbook']['bids'].append((0, 0))
-    while len(latest_data[symbol]['local_orderbook']['asks']) < 5:
-        latest_data[symbol]['local_orderbook']['asks'].append((float('inf'), 0))
-
-    latest_data[symbol]['local_orderbook']['time'] = new_data['time']
+    if logger.isEnabledFor(logging.DEBUG):
+        logging.debug(f"new_data: {new_data}")
+    # new_data is a decoder.BookUpdate, l2Book frames are full snapshots and replace the entire local orderbook
+    latest_data[symbol]['local_orderbook'].apply_update(new_data)
 def get_timestamp(): #confirmed
     return int(time.time())
 def sign(message, secret_key): #confirmed
@@ -81,17 +126,6 @@ def sign(message, secret_key): #confirmed
     d = mac.digest()
     return base64.b64encode(d)
 
-class RateLimiter: #confirmed
-    def __init__(self, interval):
-        self.interval = interval
-        self.last_check = {}
-
-    def should_process(self, symbol):
-        current_time = time.time()
-        if symbol not in self.last_check or current_time - self.last_check[symbol] >= self.interval:
-            self.last_check[symbol] = current_time
-            return True
-        return False
 def handle_message(message):
     logging.info(f"Received message: {message}")
 def get_current_utc_time_with_ms(): #confirmed
@@ -106,7 +140,6 @@ def round_significant_digits(value, significant_digits): #confirmed
 def get_current_time_ms(): #confirmed
     return int(time.time() * 1000)
 
-rate_limiter = RateLimiter(interval=0.025)
 def calculate_impact_price(order_book, imn) ->float: #confirmed
     accumulated_notional = 0.0
     accumulated_quantity = 0.0
@@ -124,61 +157,28 @@ def calculate_impact_price(order_book, imn) ->float: #confirmed
 
     # orderbook_data.append(message["data"])
     #TODO1
-async def hyperliquid_websocket_handler(ws_url, symbol, stream_type): # return  [level1, level2] such that levels = [px(price), sz(size), n(number of trades)] , levels1 = bid, levels2 = ask
-    global latest_data
-    while True:
-        try:
-            async with websockets.connect(ws_url) as websocket:
-                print("connected to ")
-                logging.info(f'Connected to {ws_url}')
-                subscribe_message ={
-                    "method": "subscribe",
-                    "subscription": {"type": stream_type, "coin": symbol}
-                }
-                await websocket.send(json.dumps(subscribe_message))
-                # message = await websocket.recv()
-                # process_hyperliquid_message(symbol, stream_type, message)
-                async for message in websocket:
-                    try:
-                        process_hyperliquid_message(symbol, stream_type, message)
-                    except Exception as e:
-                        logging.error(f"Error processing message for {symbol} ({stream_type}): {e}")
-                        logging.debug(f"Problematic message: {message}")
-        except websockets.exceptions.ConnectionClosed:
-                logging.warning(f"Hyperliquid WebSocket connection closed for {symbol} ({stream_type}). Reconnecting...")
-        except Exception as e:
-            logging.error(f"Error in Hyperliquid WebSocket for {symbol} ({stream_type}): {e}")
-        finally:
-            logging.info(f"Reconnecting to Hyperliquid WebSocket for {symbol} ({stream_type})...")
-            await asyncio.sleep(5)
+async def hyperliquid_websocket_handler(ws_url, symbols, stream_types): # one session for every coin, frames routed by data['coin']
+    global hyperliquid_session
+    hyperliquid_session = HyperliquidSession(ws_url, raw_callback=frame_capture.record if frame_capture else None)
+    for symbol in symbols:
+        for stream_type in stream_types:
+            await hyperliquid_session.subscribe(stream_type, symbol, partial(enqueue_hyperliquid_message, symbol))
+    await hyperliquid_session.run()
 #TODO2
-def process_hyperliquid_message(symbol, stream_type, message):
+def process_hyperliquid_message(symbol, stream_type, data): # data is the frame already parsed by HyperliquidSession
     global latest_data
-    logging.debug(f"Received hyperliquid message for {symbol} ({stream_type}): {message}")
-    logging.info(f"received message is {message}")
-    data = json.loads(message)  # parsing the data
-    print(f"Process Hyperliquid message received message is {message}")
-    time = 0
-    print(data["data"])
+    if logger.isEnabledFor(logging.DEBUG):
+        logging.debug(f"Received hyperliquid message for {symbol} ({stream_type}): {data}")
     if 'data' in data:
         if 'levels' in data["data"]:
-            levels = data["data"]["levels"]
-            bids = levels[0]  # [{'px': '97403', 'sz':'4.6913', 'n':'10'}]
-            asks = levels[1]  # [{'px': '97403', 'sz':'4.6913', 'n':'10'}]
-            # print("bids:", bids)
-            # print("asks:", asks)
-            bids = [[float(bid['px']), float(bid['sz'])] for bid in bids]
-            asks = [[float(ask['px']), float(ask['sz'])] for ask in asks]
-            new_data = {
-                'time': data['data']['time'],
-                'bids': bids,
-                'asks': asks
-            }
-            # print(new_data)
+            # levels = [bids, asks] of {'px': '97403', 'sz':'4.6913', 'n':'10'}, only the levels we use get converted
+            start = time.monotonic_ns()
+            new_data = decode_hyperliquid_l2book(data)
+            decoded = time.monotonic_ns()
             latest_data[symbol]['hyperliquid'][stream_type] = new_data
-            # print("new_data:" , new_data)
             update_local_orderbook(symbol, stream_type, new_data)
-            process_data(symbol)
+            latency_recorder.record_update(symbol, 'hyperliquid', data, new_data.time, start, decoded, time.monotonic_ns())
+            compute_scheduler.mark_dirty(symbol)
 
     else:
         logging.warning(f"Unexpected message structure for {symbol} ({stream_type}): {data}")
@@ -198,118 +198,285 @@ def cleanup_orderbook(symbol): #confirmed
 #TODO3
 def process_bybit_message(message, symbol, stream_type): # returns {"s': symbol , "ts": timestamp(ms), "b": list of bids in  a form of [bid price, bid size], "a": list of bids in  a form of [ask price, ask size], "u": updateID}
     # logging.debug(f"Received Binance message for {symbol} and {stream_type}")
-    event_time= message['ts'] #
     if 'data' in message:
-             # returns {"s": symbol, "b": list of bids in  a form of [bid price, bid size], "a": list of bids in  a form of [ask price, ask size]}
-        # print(message['data'])
-        bid = message['data']['b'] #[[bid price1, bid_size1], [bid_price2, bid_size2], .. , [bid_priceN, bid_sizeN]]
-        ask = message['data']['a']#[[ask_price1, ask_size1], [ask_price2, ask_size2], .. , [ask_priceN, ask_sizeN]]
-        bid = {float(price) : float(size) for price, size in bid}
-        ask = {float(price) : float(size) for price, size in ask}
-        latest_data[symbol]['bybit'][stream_type]['bids'] = bid
-        latest_data[symbol]['bybit'][stream_type]['asks'] = ask
-        latest_data[symbol]['bybit'][stream_type]['time'] = event_time
-        # print(latest_data[symbol]['bybit'][stream_type])
-        process_data(symbol, bybit_stream=stream_type)
-#TODO4
-async def bybit_websocket_handler(symbol, depth) : #returns dict('b':[bid price, bid size], 'a':[ask_price, ask_size])
+        # message['type'] is 'snapshot' (reset the book) or 'delta' (patch it), sizes of "0" delete a level
+        start = time.monotonic_ns()
+        update = decode_bybit_orderbook(message, symbol)
+        decoded = time.monotonic_ns()
+        latest_data[symbol]['bybit'][stream_type].apply_update(update)
+        latency_recorder.record_update(symbol, 'bybit', message, update.time, start, decoded, time.monotonic_ns())
+        compute_scheduler.mark_dirty(symbol, stream_type)
+def enqueue_bybit_message(message, symbol, stream_type): # runs on pybit threads, pending deltas for a topic are merged and never dropped
+    feed_handoff.put(('bybit', symbol, stream_type), message, merge_orderbook_messages, lossless=True)
+def enqueue_hyperliquid_message(symbol, stream_type, data): # l2Book frames are full snapshots, the newest one wins, safe to drop
+    feed_handoff.put(('hyperliquid', symbol, stream_type), data)
+async def feed_consumer(): # single consumer: all book mutation and spread computation happens here
     while True:
-        ws = WebSocket(
-            testnet=False,
-            channel_type="linear",
-        )
-        ws.orderbook_stream(
-            depth=depth,
-            symbol=f'{symbol}USDT',
-            callback=lambda message: process_bybit_message(message, symbol=symbol, stream_type = depth))
+        batch = await feed_handoff.get_batch()
+        for (venue, symbol, stream_type), message in batch.items():
+            if symbol not in latest_data:
+                continue # removed from the universe while its frames were pending
+            try:
+                if venue == 'bybit':
+                    process_bybit_message(message, symbol, stream_type)
+                else:
+                    process_hyperliquid_message(symbol, stream_type, message)
+            except Exception as e:
+                logging.error(f"Error processing {venue} message for {symbol} ({stream_type}): {e}")
+#TODO4
+async def bybit_websocket_handler(symbols, depths, stats_interval=60): #every symbol and depth on a few shared sockets
+    global bybit_manager
+    bybit_manager = BybitConnectionManager(enqueue_bybit_message, ws_url=bybit_ws_url, raw_callback=frame_capture.record if frame_capture else None)
+    try:
+        # pybit connects and subscribes synchronously, keep that off the event loop
+        await asyncio.to_thread(bybit_manager.subscribe, symbols, depths)
+        while True:
+            logging.info(f"Bybit feed stats: {bybit_manager.stats()}")
+            logging.info(f"Feed handoff stats: {feed_handoff.stats()}")
+            logging.info(f"Redis publisher stats: {redis_publisher.stats()}")
+            logging.info(f"Compute scheduler stats: {compute_scheduler.stats()}")
+            if frame_capture is not None:
+                logging.info(f"Frame capture stats: {frame_capture.stats()}")
+            if dynamic_universe:
+                logging.info(f"Symbol universe stats: {universe_manager.stats()}")
+            await asyncio.sleep(stats_interval)
+    finally:
+        bybit_manager.exit()
 # Run the asyncio event loop
 # asyncio.run(hyperliquid_stream())
 # asyncio.run(bybit_stream())
 #TODO5
-def process_data(symbol, bybit_stream = None):
+def process_data(symbol, bybit_stream = None, ladder = None): # ladder: precomputed by process_data_batch
     global last_process_time
     global latest_data
+    if bybit_stream is None:
+        bybit_stream = default_bybit_stream
     current_time = time.time() * 1000
     time_diff = current_time - last_process_time[symbol]
     last_process_time[symbol] = current_time
-    hyperliquid_data_available = latest_data[symbol]['local_orderbook']['time']  is not None
-    bybit_time =  latest_data[symbol]['bybit'][bybit_stream]['time']
-    print("before processing")
-    print(f" latest data {latest_data}")
-    if hyperliquid_data_available and latest_data[symbol]['bybit'][bybit_stream]['time'] is not None :
-        if rate_limiter.should_process(symbol):
-            current_time = get_current_time_ms()
-            #use the local orderbook for bybit data
-            hyperliquid_latest = latest_data[symbol]['local_orderbook']
-            combined_data = {
+    hyperliquid_book = latest_data[symbol]['local_orderbook']
+    bybit_book = latest_data[symbol]['bybit'][bybit_stream]
+    if logger.isEnabledFor(logging.DEBUG):
+        logging.debug(f"latest data {latest_data}")
+    if hyperliquid_book.is_ready() and bybit_book.is_ready():
+        current_time = get_current_time_ms()
+        #top 5 levels straight from the sorted books, no re-sorting
+        hyperliquid_latest = hyperliquid_book.to_dict(5)
+        combined_data = {
+            'timestamp': get_current_utc_time_with_ms(),
+            'bybit': bybit_book.to_dict(5),
+            'hyperliquid': hyperliquid_latest,
+            'timelag': current_time - min(bybit_book.time, hyperliquid_latest['time'])
+        }
+        #impact prices and spreads for the whole notional ladder in one lookup per side
+        if ladder is None:
+            ladder = impact_ladder(impact_books[symbol]['hyperliquid'], impact_books[symbol]['bybit'][bybit_stream], impact_notionals)
+        smallest = ladder[impact_notionals[0]]
+        impact_bid_hyperliquid = smallest['impact_bid_price_hyperliquid']
+        impact_ask_hyperliquid = smallest['impact_ask_price_hyperliquid']
+        impact_bid_bybit = smallest['impact_bid_price_bybit']
+        impact_ask_bybit = smallest['impact_ask_price_bybit']
+        if all(x is not None for x in [impact_bid_hyperliquid, impact_ask_hyperliquid, impact_bid_bybit, impact_ask_bybit]): #means all of the component in iterator should not be none
+            combined_data_impact = {
                 'timestamp': get_current_utc_time_with_ms(),
-                'bybit': {
-                    'time': latest_data[symbol]['bybit'][bybit_stream]['time'],
-                    'bids': get_top_n(latest_data[symbol]['bybit'][bybit_stream]['bids'], 5, reverse=True),
-                    'asks': get_top_n(latest_data[symbol]['bybit'][bybit_stream]['asks'], 5)
-                },
-                'hyperliquid': hyperliquid_latest,
-                'timelag': current_time - min(latest_data[symbol]['bybit'][bybit_stream]['time'], hyperliquid_latest['time'])
+                'timestamp_ms': current_time,
+                'best_bid_price_hyperliquid': hyperliquid_latest['bids'][0][0],
+                'best_ask_price_hyperliquid': hyperliquid_latest['asks'][0][0],
+                'best_bid_price_bybit': combined_data['bybit']['bids'][0][0],
+                'best_ask_price_bybit': combined_data['bybit']['asks'][0][0],
+                'entry_spread': round(100 * (hyperliquid_latest['bids'][0][0] - combined_data['bybit']['asks'][0][0]) / combined_data['bybit']['asks'][0][0], 4),
+                'exit_spread': round(100 * (hyperliquid_latest['asks'][0][0] - combined_data['bybit']['bids'][0][0]) / combined_data['bybit']['bids'][0][0], 4),
+                'hyperliquid_orderbook': hyperliquid_latest,
+                'bybit_orderbook': combined_data['bybit'],
+                'impact_ladder': ladder,
+                'timelag': combined_data['timelag'],
+                'impact_price_reached': True
             }
-            impact_bid_hyperliquid = calculate_impact_price(hyperliquid_latest['bids'], 100)
-            impact_ask_hyperliquid = calculate_impact_price(hyperliquid_latest['asks'], 100)
-            impact_bid_bybit = calculate_impact_price(combined_data['bybit']['bids'], 100) #confirmed
-            impact_ask_bybit = calculate_impact_price(combined_data['bybit']['asks'], 100) #confirmed
-            if all(x is not None for x in [impact_bid_hyperliquid, impact_ask_hyperliquid, impact_bid_bybit, impact_ask_bybit]): #means all of the component in iterator should not be none
-                combined_data_impact = {
-                    'timestamp': get_current_utc_time_with_ms(),
-                    'best_bid_price_hyperliquid': hyperliquid_latest['bids'][0][0],
-                    'best_ask_price_hyperliquid': hyperliquid_latest['asks'][0][0],
-                    'best_bid_price_bybit': combined_data['bybit']['bids'][0][0],
-                    'best_ask_price_bybit': combined_data['bybit']['asks'][0][0],
-                    'entry_spread': round(100 * (hyperliquid_latest['bids'][0][0] - combined_data['bybit']['asks'][0][0]) / combined_data['bybit']['asks'][0][0], 4),
-                    'exit_spread': round(100 * (hyperliquid_latest['asks'][0][0] - combined_data['bybit']['bids'][0][0]) / combined_data['bybit']['bids'][0][0], 4),
-                    'hyperliquid_orderbook': hyperliquid_latest,
-                    'bybit_orderbook': combined_data['bybit'],
-                    'timelag': combined_data['timelag'],
-                    'impact_price_reached': True
-                }
-                if impact_bid_hyperliquid > impact_ask_hyperliquid:
-                    logging.info(
-                        f'Hyperliquid {symbol}"s impact bid {impact_bid_hyperliquid} is greater than its impact ask {impact_ask_hyperliquid} ')
-                if impact_bid_bybit > impact_ask_bybit:
-                    logging.info(
-                        f'Hyperliquid {symbol}"s impact bid {impact_bid_bybit} is greater than its impact ask {impact_ask_bybit} ')
-            else:
-                combined_data_impact = {
-                    'timestamp': get_current_utc_time_with_ms(),
-                    'entry_spread': None,
-                    'exit_spread': None,
-                    'best_bid_price_hyperliquid': hyperliquid_latest['bids'][0][0] if hyperliquid_latest['bids'] else None,
-                    'best_ask_price_hyperliquid': hyperliquid_latest['asks'][0][0] if hyperliquid_latest['asks'] else None,
-                    'best_bid_price_bybit': combined_data['bybit']['bids'][0][0] if combined_data['bybit']['bids'] else None,
-                    'best_ask_price_bybit': combined_data['bybit']['asks'][0][0] if combined_data['bybit']['asks'] else None,
-                    'impact_bid_price_hyperliquid': None,
-                    'impact_ask_price_hyperliquid': None,
-                    'impact_bid_price_hyperliquid': None,
-                    'impact_ask_price_hyperliquid': None,
-                    'hyperliquid_orderbook': hyperliquid_latest,
-                    'bybit_orderbook': combined_data['bybit'],
-                    'timelag': combined_data['timelag'],
-                    'impact_price_flag': False
-                }
-            # redis_client.rpush(f'combined_data_{symbol}', json.dumps(combined_data_impact))
-            # redis_client.ltrim(f'combined_data_{symbol}', -500, -1)
-            print(f'{time_diff:.2f}ms | {symbol} - {combined_data_impact}')
+            if impact_bid_hyperliquid > impact_ask_hyperliquid:
+                logging.info(
+                    f'Hyperliquid {symbol}"s impact bid {impact_bid_hyperliquid} is greater than its impact ask {impact_ask_hyperliquid} ')
+            if impact_bid_bybit > impact_ask_bybit:
+                logging.info(
+                    f'Hyperliquid {symbol}"s impact bid {impact_bid_bybit} is greater than its impact ask {impact_ask_bybit} ')
         else:
-            logging.debug(f"Rate limited: Skipping processing for {symbol}")
-    else:
+            combined_data_impact = {
+                'timestamp': get_current_utc_time_with_ms(),
+                'timestamp_ms': current_time,
+                'entry_spread': None,
+                'exit_spread': None,
+                'best_bid_price_hyperliquid': hyperliquid_latest['bids'][0][0] if hyperliquid_latest['bids'] else None,
+                'best_ask_price_hyperliquid': hyperliquid_latest['asks'][0][0] if hyperliquid_latest['asks'] else None,
+                'best_bid_price_bybit': combined_data['bybit']['bids'][0][0] if combined_data['bybit']['bids'] else None,
+                'best_ask_price_bybit': combined_data['bybit']['asks'][0][0] if combined_data['bybit']['asks'] else None,
+                'impact_bid_price_hyperliquid': None,
+                'impact_ask_price_hyperliquid': None,
+                'impact_bid_price_bybit': None,
+                'impact_ask_price_bybit': None,
+                'impact_ladder': ladder,
+                'hyperliquid_orderbook': hyperliquid_latest,
+                'bybit_orderbook': combined_data['bybit'],
+                'timelag': combined_data['timelag'],
+                'impact_price_flag': False
+            }
+        computed = time.monotonic_ns()
+        if top_of_book is not None:
+            top_of_book.publish(symbol, combined_data_impact)
+        redis_publisher.publish(symbol, combined_data_impact)
+        latency_recorder.record_compute(symbol, computed, time.monotonic_ns())
+        tick_dumper.dump(symbol, combined_data_impact, time_diff, current_time)
+    elif logger.isEnabledFor(logging.DEBUG):
         logging.debug(f"Not enough data to process for {symbol}")
 
+def queue_batch(symbol, bybit_stream = None): # batch mode scheduler callback, every symbol due in this loop pass shares one computation
+    global batch_handle
+    batch_pending[symbol] = bybit_stream
+    if batch_handle is None:
+        batch_handle = asyncio.get_running_loop().call_soon(process_data_batch)
 
-async def main():
-    tasks = []
+def _optional(value):
+    return None if value != value else value # NaN -> None
+
+def process_data_batch(): # impact ladders of every queued symbol from one vectorized book_store pass, then process_data
+    global batch_handle
+    batch_handle = None
+    pending = dict(batch_pending)
+    batch_pending.clear()
+    ready = []
+    for symbol, bybit_stream in pending.items():
+        if symbol not in latest_data:
+            continue
+        bybit_stream = bybit_stream or default_bybit_stream
+        hyperliquid_book = latest_data[symbol]['local_orderbook']
+        bybit_book = latest_data[symbol]['bybit'][bybit_stream]
+        if not (hyperliquid_book.is_ready() and bybit_book.is_ready()):
+            continue
+        if book_store.covers(hyperliquid_book, bybit_book):
+            ready.append((symbol, bybit_stream, book_store.load(symbol, hyperliquid_book, bybit_book)))
+            continue
+        try: # deeper than book_store holds, the per-symbol impact_ladder sees every level
+            process_data(symbol, bybit_stream)
+        except Exception as e:
+            logging.error(f"Error computing {symbol}: {e}")
+    if not ready:
+        return
+    result = book_store.compute([row for _, _, row in ready], impact_notionals)
+    impact = result['impact'].tolist()
+    entry_spread = result['impact_entry_spread'].tolist()
+    exit_spread = result['impact_exit_spread'].tolist()
+    for i, (symbol, bybit_stream, _) in enumerate(ready):
+        (hyperliquid_bids, hyperliquid_asks), (bybit_bids, bybit_asks) = impact[i]
+        ladder = {notional: {
+            'impact_bid_price_hyperliquid': _optional(hyperliquid_bids[j]),
+            'impact_ask_price_hyperliquid': _optional(hyperliquid_asks[j]),
+            'impact_bid_price_bybit': _optional(bybit_bids[j]),
+            'impact_ask_price_bybit': _optional(bybit_asks[j]),
+            'entry_spread': _optional(entry_spread[i][j]),
+            'exit_spread': _optional(exit_spread[i][j]),
+        } for j, notional in enumerate(impact_notionals)}
+        try:
+            process_data(symbol, bybit_stream, ladder)
+        except Exception as e:
+            logging.error(f"Error computing {symbol}: {e}")
+
+def make_compute_scheduler(): # book updates only mark a symbol dirty, process_data runs at most every compute_interval on the latest books
+    if compute_mode == 'batch':
+        return CoalescingScheduler(queue_batch, compute_interval, compute_intervals)
+    return CoalescingScheduler(process_data, compute_interval, compute_intervals)
+compute_scheduler = make_compute_scheduler()
+
+def replay_frame(venue, raw, recv_wall_ns): # a captured frame through the same decode -> book -> process_data path as a live one
+    stamp = receive_stamp()
+    message = stamp_receive(json_loads(raw), stamp)
+    message['_recv_wall_ns'] = recv_wall_ns # keep the exchange latency of the original capture
+    if venue == 'bybit':
+        target = BybitConnectionManager.parse_topic(message.get('topic'))
+        if target is not None and target[0] in latest_data and target[1] in latest_data[target[0]]['bybit']:
+            process_bybit_message(message, *target)
+    else:
+        stream_type = message.get('channel')
+        data = message.get('data')
+        if stream_type in hyperliquid_stream_types and isinstance(data, dict) and data.get('coin') in latest_data:
+            process_hyperliquid_message(data['coin'], stream_type, message)
+
+async def replay_capture(paths, speed=None, interval=0.0): # redis_publisher.run is not started, so nothing reaches redis
+    compute_scheduler.bind(asyncio.get_running_loop())
+    compute_scheduler.default_interval = interval
+    count = await replay(paths, replay_frame, speed)
+    await asyncio.sleep(interval) # let the trailing computations run
+    return count
+
+
+async def add_symbols(new_symbols): # live: books first, then both venues' subscriptions
+    for symbol in new_symbols:
+        if symbol not in latest_data:
+            add_symbol_state(symbol)
+        if symbol not in symbols:
+            symbols.append(symbol)
+    if bybit_manager is not None:
+        await asyncio.to_thread(bybit_manager.subscribe, new_symbols, bybit_stream_types)
+    if hyperliquid_session is not None:
+        for symbol in new_symbols:
+            for stream_type in hyperliquid_stream_types:
+                await hyperliquid_session.subscribe(stream_type, symbol, partial(enqueue_hyperliquid_message, symbol))
+
+async def remove_symbols(old_symbols): # live: unsubscribe both venues, then drop the books
+    if bybit_manager is not None:
+        await asyncio.to_thread(bybit_manager.unsubscribe, old_symbols, bybit_stream_types)
+    if hyperliquid_session is not None:
+        for symbol in old_symbols:
+            for stream_type in hyperliquid_stream_types:
+                await hyperliquid_session.unsubscribe(stream_type, symbol)
+    for symbol in old_symbols:
+        remove_symbol_state(symbol)
+        if symbol in symbols:
+            symbols.remove(symbol)
+
+universe_manager = UniverseManager(add_symbols, remove_symbols, symbols, universe_refresh_interval, max_symbols=universe_max_symbols)
+
+def configure(settings): # overrides module settings before main() and rebuilds what import-time code built from the defaults
+    global tick_dumper, redis_publisher, frame_capture, top_of_book, compute_scheduler, book_store, universe_manager
+    for name, value in settings.items():
+        if name not in globals():
+            raise AttributeError(f"Unknown collector setting {name}")
+        globals()[name] = value
+    for symbol in list(latest_data):
+        remove_symbol_state(symbol)
+    tick_dumper = TickDumper(tick_log_interval, tick_log_binary_path)
+    redis_publisher = make_redis_publisher()
+    redis_publisher.latency_recorder = latency_recorder
+    if frame_capture is not None:
+        frame_capture.close()
+    frame_capture = make_frame_capture()
+    if top_of_book is not None:
+        top_of_book.close()
+    top_of_book = TopOfBookWriter(top_of_book_path) if top_of_book_path else None
+    compute_scheduler = make_compute_scheduler()
+    book_store = BookStore(levels=max(bybit_stream_types))
     for symbol in symbols:
-        for stream_type in hyperliquid_stream_types:
-            tasks.append(hyperliquid_websocket_handler(hyperliquid_ws_url , symbol, stream_type))
-        for stream_type in bybit_stream_types:
-            tasks.append(bybit_websocket_handler(symbol,50))
-    await asyncio.gather(*tasks)
+        add_symbol_state(symbol)
+    universe_manager = UniverseManager(add_symbols, remove_symbols, symbols, universe_refresh_interval, max_symbols=universe_max_symbols)
+
+async def main():
+    feed_handoff.bind(asyncio.get_running_loop())
+    compute_scheduler.bind(asyncio.get_running_loop())
+    if dynamic_universe:
+        # resolve the listing before the feeds start so the first subscribe covers it
+        await universe_manager.refresh()
+    tasks = [
+        feed_consumer(),
+        redis_publisher.run(),
+        publish_latency(latency_recorder, redis_client, 'feed_latency'),
+        bybit_websocket_handler(symbols, bybit_stream_types),
+        hyperliquid_websocket_handler(hyperliquid_ws_url, symbols, hyperliquid_stream_types),
+    ]
+    if latency_port is not None:
+        tasks.append(serve_latency(latency_recorder, '127.0.0.1', latency_port))
+    if dynamic_universe:
+        tasks.append(universe_manager.run())
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        await metadata_client.close()
 
 async def run():
     while True:
@@ -327,4 +494,7 @@ if __name__ == "__main__":
         print("Script terminated by user")
     except Exception as e:
         logging.error(f"An unexpected error occurred: {str(e)}")
-        logging.info("Restarting the script...")
\ No newline at end of file
+        logging.info("Restarting the script...")
+    finally:
+        if frame_capture is not None:
+            frame_capture.close()
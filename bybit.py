@@ -12,7 +12,7 @@ import hmac
 import base64
 from pybit.unified_trading import WebSocket
 from time import sleep
-from byBitHyperLiquid import update_local_orderbook, process_data, rate_limiter
+from byBitHyperLiquid import update_local_orderbook, process_data
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s %(levelname)s:%(message)s',
@@ -0,0 +1,200 @@
+import json
+import logging
+from uuid import uuid4
+from pybit.unified_trading import WebSocket
+from decoder import loads
+from latency import receive_stamp, stamp_receive
+
+
+class _OrderbookWebSocket(WebSocket):
+    '''
+    pybit WebSocket that hands raw snapshot/delta frames to the router. The stock
+    _process_normal_message keeps its own copy of every book and deep-copies it into each
+    callback, which is exactly the work OrderBook already does incrementally.
+    '''
+    def __init__(self, router, raw_callback=None, ws_url=None, **kwargs):
+        self.router = router
+        self.raw_callback = raw_callback  # raw_callback(venue, raw) sees every frame before parsing
+        self.ws_url = ws_url  # overrides pybit's endpoint, e.g. a local simulator
+        super().__init__(**kwargs)
+
+    def _connect(self, url):
+        super()._connect(self.ws_url or url)
+
+    def _on_message(self, message):
+        stamp = receive_stamp()
+        if self.raw_callback is not None:
+            self.raw_callback('bybit', message)
+        # same as pybit's, with the fastest installed JSON parser
+        message = loads(message)
+        if self._is_custom_pong(message):
+            return
+        self.callback(stamp_receive(message, stamp))
+
+    def _process_normal_message(self, message):
+        self.router(message)
+
+    def unsubscribe_topics(self, topics):
+        '''
+        Unsubscribes only the given topics. pybit's unsubscribe replays the whole original
+        request, which would drop every other symbol subscribed in the same batch.
+        '''
+        topics = set(topics)
+        self.ws.send(json.dumps({"op": "unsubscribe", "req_id": str(uuid4()), "args": sorted(topics)}))
+        for topic in topics:
+            self.callback_directory.pop(topic, None)
+        # keep the resubscribe-on-reconnect requests in step
+        for req_id, request in list(self.subscriptions.items()):
+            request = json.loads(request)
+            args = [topic for topic in request["args"] if topic not in topics]
+            if not args:
+                del self.subscriptions[req_id]
+            elif len(args) != len(request["args"]):
+                self.subscriptions[req_id] = json.dumps(dict(request, args=args))
+
+    def _process_subscription_message(self, message):
+        # pybit looks the req_id up in self.subscriptions, which it only fills after send()
+        # returns; a fast ack raced that and killed the socket with a KeyError
+        if message.get("success") is False:
+            logging.error(f"Bybit subscribe failed: {message}")
+
+    def _process_unsubscription_message(self, message):
+        if message.get("success") is False:
+            logging.error(f"Bybit unsubscribe failed: {message}")
+
+
+class BybitConnectionManager:
+    '''
+    Holds every Bybit orderbook subscription (symbol x depth) on a small, fixed number of
+    pybit sockets. Topics are packed onto a connection until it holds topics_per_connection
+    of them, and every frame is routed by its topic to callback(message, symbol, depth).
+    '''
+    def __init__(self, callback, topics_per_connection=200, subscribe_batch_size=10, channel_type="linear", testnet=False, ws_url=None, raw_callback=None):
+        self.callback = callback
+        self.ws_url = ws_url
+        self.raw_callback = raw_callback
+        self.topics_per_connection = topics_per_connection
+        self.subscribe_batch_size = subscribe_batch_size  # bybit caps the args of one subscribe request
+        self.channel_type = channel_type
+        self.testnet = testnet
+        self.connections = []  # [[websocket, topic_count]]
+        self.subscriptions = {}  # 'orderbook.50.BTCUSDT' -> ('BTC', 50)
+        self.topic_connections = {}  # 'orderbook.50.BTCUSDT' -> the connection carrying it
+        self.unrouted = 0
+
+    @staticmethod
+    def topic(symbol, depth):
+        return f"orderbook.{depth}.{symbol}USDT"
+
+    @staticmethod
+    def parse_topic(topic):
+        # 'orderbook.50.BTCUSDT' -> ('BTC', 50), None for anything else
+        parts = topic.split('.') if topic else ()
+        if len(parts) != 3 or parts[0] != 'orderbook' or not parts[2].endswith('USDT'):
+            return None
+        return parts[2][:-4], int(parts[1])
+
+    def _open_connection(self):
+        ws = _OrderbookWebSocket(self._route, self.raw_callback, self.ws_url, testnet=self.testnet, channel_type=self.channel_type)
+        self.connections.append([ws, 0])
+        logging.info(f"Opened Bybit connection #{len(self.connections)}")
+        return self.connections[-1]
+
+    def _connection_with_room(self):
+        for connection in self.connections:
+            if connection[1] < self.topics_per_connection:
+                return connection
+        return self._open_connection()
+
+    def subscribe(self, symbols, depths):
+        pending = [(symbol, depth) for depth in depths for symbol in symbols
+                   if self.topic(symbol, depth) not in self.subscriptions]
+        while pending:
+            connection = self._connection_with_room()
+            room = self.topics_per_connection - connection[1]
+            batch, pending = pending[:room], pending[room:]
+            by_depth = {}
+            for symbol, depth in batch:
+                by_depth.setdefault(depth, []).append(symbol)
+            for depth, depth_symbols in by_depth.items():
+                for i in range(0, len(depth_symbols), self.subscribe_batch_size):
+                    chunk = depth_symbols[i:i + self.subscribe_batch_size]
+                    # register routes first, the snapshot can arrive before orderbook_stream returns
+                    for symbol in chunk:
+                        self.subscriptions[self.topic(symbol, depth)] = (symbol, depth)
+                        self.topic_connections[self.topic(symbol, depth)] = connection
+                    connection[0].orderbook_stream(
+                        depth=depth,
+                        symbol=[f"{symbol}USDT" for symbol in chunk],
+                        callback=self._route)
+            connection[1] += len(batch)
+        logging.info(f"Bybit: {self.subscription_count()} subscriptions on {self.connection_count()} connections")
+
+    def unsubscribe(self, symbols, depths):
+        by_connection = {}
+        for depth in depths:
+            for symbol in symbols:
+                topic = self.topic(symbol, depth)
+                if self.subscriptions.pop(topic, None) is None:
+                    continue
+                connection = self.topic_connections.pop(topic)
+                by_connection.setdefault(id(connection), (connection, []))[1].append(topic)
+        for connection, topics in by_connection.values():
+            # freed room is reused by the next subscribe
+            connection[0].unsubscribe_topics(topics)
+            connection[1] -= len(topics)
+        logging.info(f"Bybit: {self.subscription_count()} subscriptions on {self.connection_count()} connections")
+
+    def _route(self, message):
+        target = self.subscriptions.get(message.get('topic'))
+        if target is None:
+            self.unrouted += 1
+            return
+        symbol, depth = target
+        self.callback(message, symbol, depth)
+
+    def connection_count(self):
+        return len(self.connections)
+
+    def subscription_count(self):
+        return len(self.subscriptions)
+
+    def is_connected(self):
+        return all(ws.is_connected() for ws, _ in self.connections)
+
+    def stats(self):
+        return {
+            'connections': self.connection_count(),
+            'subscriptions': self.subscription_count(),
+            'connected': self.is_connected(),
+            'unrouted': self.unrouted,
+        }
+
+    def exit(self):
+        for ws, _ in self.connections:
+            ws.exit()
+        self.connections = []
+        self.subscriptions = {}
+        self.topic_connections = {}
+
+
+def merge_orderbook_messages(older, newer):
+    '''
+    Folds two pending Bybit orderbook frames for the same topic into one equivalent frame,
+    so they can be conflated without losing levels. A snapshot replaces whatever came
+    before it; a delta is overlaid price by price, and on top of a snapshot its deletions
+    ("0" sizes) are applied so the result is still a valid snapshot.
+    '''
+    if newer.get('type') != 'delta':
+        return newer
+    is_snapshot = older.get('type') != 'delta'
+    merged = {}
+    for side in ('b', 'a'):
+        # key by float so "111" and "111.0" land on the same level
+        levels = {float(price): size for price, size in older['data'][side]}
+        levels.update((float(price), size) for price, size in newer['data'][side])
+        if is_snapshot:
+            levels = {price: size for price, size in levels.items() if float(size) != 0}
+        merged[side] = list(levels.items())
+    data = dict(newer['data'], **merged)
+    return dict(newer, type='snapshot' if is_snapshot else 'delta', data=data)
@@ -0,0 +1,158 @@
+import argparse
+import asyncio
+import glob
+import gzip
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime, timezone
+
+
+class FrameCapture:
+    '''
+    Appends raw websocket frames to gzip segment files from a background thread. The
+    hot path only stamps the receive time and puts a tuple on a queue. Each line is
+    "<receive epoch ns>\\t<venue>\\t<raw frame>". A new segment starts every
+    segment_seconds or once segment_bytes of raw frames have been written. The open segment
+    is flushed every flush_interval seconds, so a crash loses at most that much; close()
+    (registered with atexit by the collector) finishes the last segment cleanly.
+    '''
+    def __init__(self, directory, segment_seconds=300, segment_bytes=256 * 1024 * 1024, compresslevel=1, max_queue=200000,
+                 flush_interval=1.0):
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.segment_bytes = segment_bytes
+        self.compresslevel = compresslevel  # gzip level 1: most of the size win for a fraction of the CPU
+        self.flush_interval = flush_interval
+        self.queue = queue.Queue(max_queue)
+        self.captured = 0
+        self.dropped = 0
+        self.segments = 0
+        os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name='frame-capture', daemon=True)
+        self._thread.start()
+
+    def record(self, venue, raw, recv_wall_ns=None):
+        # safe to call from any thread
+        try:
+            self.queue.put_nowait((recv_wall_ns or time.time_ns(), venue, raw))
+        except queue.Full:
+            self.dropped += 1
+
+    def _open_segment(self):
+        name = datetime.now(timezone.utc).strftime('frames-%Y%m%dT%H%M%S.%fZ.log.gz')
+        self.segments += 1
+        return gzip.open(os.path.join(self.directory, name), 'wt', compresslevel=self.compresslevel, encoding='utf-8')
+
+    def _run(self):
+        f = None
+        opened = 0.0
+        written = 0
+        flushed = time.monotonic()
+        while True:
+            try:
+                item = self.queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                item = False
+            if f is not None and time.monotonic() - flushed >= self.flush_interval:
+                # sync flush: everything written so far decompresses even without the gzip trailer
+                f.flush()
+                flushed = time.monotonic()
+            if item is None:
+                break
+            if item is False:
+                continue
+            if f is None or written >= self.segment_bytes or time.monotonic() - opened >= self.segment_seconds:
+                if f is not None:
+                    f.close()
+                f = self._open_segment()
+                opened = time.monotonic()
+                written = 0
+            recv_wall_ns, venue, raw = item
+            if isinstance(raw, bytes):
+                raw = raw.decode('utf-8')
+            if '\n' in raw:
+                raw = raw.replace('\n', ' ')
+            line = f'{recv_wall_ns}\t{venue}\t{raw}\n'
+            f.write(line)
+            written += len(line)
+            self.captured += 1
+        if f is not None:
+            f.close()
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+
+    def stats(self):
+        return {'captured': self.captured, 'dropped': self.dropped, 'segments': self.segments, 'queued': self.queue.qsize()}
+
+
+def segment_paths(path):
+    # a directory of segments (oldest first, the file names sort by time) or a single file
+    if os.path.isdir(path):
+        return sorted(glob.glob(os.path.join(path, 'frames-*.log.gz')))
+    return [path]
+
+
+def iter_frames(paths):
+    for i, path in enumerate(paths):
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            try:
+                for line in f:
+                    try:
+                        recv_wall_ns, venue, raw = line.rstrip('\n').split('\t', 2)
+                    except ValueError:
+                        continue  # truncated last line of a segment that was being written
+                    yield int(recv_wall_ns), venue, raw
+            except EOFError:
+                # no gzip trailer: the segment is still being written, or the writer died
+                if i < len(paths) - 1:
+                    logging.warning(f"Capture segment {path} is truncated, continuing with the next one")
+
+
+async def replay(paths, handler, speed=None):
+    '''
+    Feeds captured frames to handler(venue, raw, recv_wall_ns) in capture order. speed=None
+    replays as fast as possible (still yielding to the loop before every frame so scheduled
+    computations run); speed=1.0 reproduces the original inter-frame timing, 10.0 runs ten
+    times faster. Returns the number of frames replayed.
+    '''
+    loop = asyncio.get_running_loop()
+    count = 0
+    first_ns = None
+    start = loop.time()
+    for recv_wall_ns, venue, raw in iter_frames(paths):
+        delay = 0
+        if speed:
+            if first_ns is None:
+                first_ns = recv_wall_ns
+            delay = start + (recv_wall_ns - first_ns) / 1e9 / speed - loop.time()
+        await asyncio.sleep(max(delay, 0))
+        handler(venue, raw, recv_wall_ns)
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    # python capture.py captures/ [--speed 1.0] [--compute-interval 0]
+    parser = argparse.ArgumentParser(description="Replay captured frames through decode -> book -> process_data")
+    parser.add_argument('path', help="segment file or capture directory")
+    parser.add_argument('--speed', type=float, default=None, help="real-time multiplier, omit for as fast as possible")
+    parser.add_argument('--compute-interval', type=float, default=0.0,
+                        help="scheduler interval during replay, 0 computes after every update")
+    args = parser.parse_args()
+
+    import byBitHyperLiquid
+
+    async def run_replay():
+        started = time.perf_counter()
+        count = await byBitHyperLiquid.replay_capture(segment_paths(args.path), args.speed, args.compute_interval)
+        elapsed = time.perf_counter() - started
+        logging.info(f"Replayed {count} frames in {elapsed:.2f}s ({count / elapsed if elapsed else 0:,.0f} frames/sec)")
+        logging.info(f"Latency: {byBitHyperLiquid.latency_recorder.summary()}")
+
+    asyncio.run(run_replay())
@@ -0,0 +1,191 @@
+import json
+import random
+import sys
+import time
+
+# fastest installed JSON parser wins, the stdlib is the fallback
+try:
+    import orjson
+    json_backend = 'orjson'
+    loads = orjson.loads
+
+    def dumps(obj):
+        # int keys (the impact ladder notionals) are allowed by json.dumps, orjson needs the option
+        return orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+except ImportError:
+    try:
+        import ujson
+        json_backend = 'ujson'
+        loads = ujson.loads
+        dumps = ujson.dumps
+    except ImportError:
+        json_backend = 'json'
+        loads = json.loads
+        dumps = json.dumps
+
+hyperliquid_max_levels = 20  # l2Book frames carry 20 levels per side, lower it to convert fewer
+
+
+class BookUpdate:
+    '''
+    Compact, typed book update shared by both venues. kind is 'snapshot' or 'delta',
+    time is the exchange timestamp in ms, bids/asks are lists of (price, size) floats.
+    '''
+    __slots__ = ('venue', 'symbol', 'kind', 'time', 'bids', 'asks', 'update_id')
+
+    def __init__(self, venue, symbol, kind, time, bids, asks, update_id=None):
+        self.venue = venue
+        self.symbol = symbol
+        self.kind = kind
+        self.time = time
+        self.bids = bids
+        self.asks = asks
+        self.update_id = update_id
+
+    def __repr__(self):
+        return f"BookUpdate({self.venue}, {self.symbol}, {self.kind}, time={self.time}, bids={self.bids}, asks={self.asks})"
+
+
+def decode_hyperliquid_l2book(frame, max_levels=None):
+    '''
+    frame is the raw websocket payload or the already parsed dict. l2Book frames are full
+    snapshots, so only the best max_levels per side are converted to floats.
+    '''
+    if isinstance(frame, (str, bytes)):
+        frame = loads(frame)
+    data = frame.get('data')
+    if not data or 'levels' not in data:
+        return None
+    if max_levels is None:
+        max_levels = hyperliquid_max_levels
+    bids, asks = data['levels'][0], data['levels'][1]
+    return BookUpdate(
+        'hyperliquid',
+        data.get('coin'),
+        'snapshot',
+        data['time'],
+        [(float(level['px']), float(level['sz'])) for level in bids[:max_levels]],
+        [(float(level['px']), float(level['sz'])) for level in asks[:max_levels]],
+    )
+
+
+def decode_bybit_orderbook(message, symbol=None):
+    '''
+    message is a Bybit v5 orderbook frame (raw or parsed). Every level is converted: deltas
+    patch the whole book and a truncated snapshot would leave holes once deeper levels move up.
+    '''
+    if isinstance(message, (str, bytes)):
+        message = loads(message)
+    data = message.get('data')
+    if data is None:
+        return None
+    return BookUpdate(
+        'bybit',
+        symbol if symbol is not None else data.get('s'),
+        'delta' if message.get('type') == 'delta' else 'snapshot',
+        message['ts'],
+        [(float(price), float(size)) for price, size in data['b']],
+        [(float(price), float(size)) for price, size in data['a']],
+        data.get('u'),
+    )
+
+
+decoders = {
+    ('hyperliquid', 'l2Book'): decode_hyperliquid_l2book,
+    ('bybit', 'orderbook'): decode_bybit_orderbook,
+}
+
+
+def register_decoder(venue, channel, decoder):
+    # new channels (trades, bbo, ...) plug in here without touching the feed handlers
+    decoders[(venue, channel)] = decoder
+
+
+def get_decoder(venue, channel):
+    return decoders[(venue, channel)]
+
+
+def _legacy_hyperliquid(raw):
+    # what process_hyperliquid_message used to do per frame
+    data = json.loads(raw)
+    levels = data["data"]["levels"]
+    bids = [[float(bid['px']), float(bid['sz'])] for bid in levels[0]]
+    asks = [[float(ask['px']), float(ask['sz'])] for ask in levels[1]]
+    return {'time': data['data']['time'], 'bids': bids, 'asks': asks}
+
+
+def _legacy_bybit(raw):
+    # what pybit + process_bybit_message used to do per frame
+    message = json.loads(raw)
+    bid = {float(price): float(size) for price, size in message['data']['b']}
+    ask = {float(price): float(size) for price, size in message['data']['a']}
+    return bid, ask
+
+
+def synthetic_frames(n=5000, depth=200, seed=0):
+    '''Hyperliquid l2Book and Bybit orderbook frames shaped like the live feeds.'''
+    rng = random.Random(seed)
+    mid = 60000.0
+    hyperliquid = []
+    bybit = []
+    for i in range(n):
+        levels = [
+            [{'px': f"{mid - j - 1:.1f}", 'sz': f"{rng.uniform(0.01, 5):.5f}", 'n': rng.randint(1, 20)} for j in range(20)],
+            [{'px': f"{mid + j + 1:.1f}", 'sz': f"{rng.uniform(0.01, 5):.5f}", 'n': rng.randint(1, 20)} for j in range(20)],
+        ]
+        hyperliquid.append(json.dumps({'channel': 'l2Book', 'data': {'coin': 'BTC', 'time': i, 'levels': levels}}))
+        kind = 'snapshot' if i % 100 == 0 else 'delta'
+        count = depth if kind == 'snapshot' else rng.randint(1, 30)
+        b = [[f"{mid - rng.randint(1, depth) * 0.1:.1f}", f"{rng.uniform(0, 5):.3f}"] for _ in range(count)]
+        a = [[f"{mid + rng.randint(1, depth) * 0.1:.1f}", f"{rng.uniform(0, 5):.3f}"] for _ in range(count)]
+        bybit.append(json.dumps({'topic': f'orderbook.{depth}.BTCUSDT', 'type': kind, 'ts': i,
+                                 'data': {'s': 'BTCUSDT', 'b': b, 'a': a, 'u': i, 'seq': i}, 'cts': i}))
+    return hyperliquid, bybit
+
+
+def load_frames(path):
+    '''One raw frame per line; frames are split by venue from their shape.'''
+    hyperliquid = []
+    bybit = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if '"channel"' in line:
+                hyperliquid.append(line)
+            elif '"topic"' in line:
+                bybit.append(line)
+    return hyperliquid, bybit
+
+
+def _rate(fn, frames, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for frame in frames:
+            fn(frame)
+        best = min(best, time.perf_counter() - start)
+    return len(frames) / best
+
+
+def benchmark(hyperliquid, bybit, max_levels=5):
+    results = {}
+    if hyperliquid:
+        results['hyperliquid legacy'] = _rate(_legacy_hyperliquid, hyperliquid)
+        results[f'hyperliquid decoder (top {max_levels})'] = _rate(lambda f: decode_hyperliquid_l2book(f, max_levels), hyperliquid)
+    if bybit:
+        results['bybit legacy'] = _rate(_legacy_bybit, bybit)
+        results['bybit decoder'] = _rate(decode_bybit_orderbook, bybit)
+    return results
+
+
+if __name__ == "__main__":
+    # python decoder.py [frames.txt]  -- recorded frames, one per line; synthetic frames otherwise
+    if len(sys.argv) > 1:
+        hyperliquid_frames, bybit_frames = load_frames(sys.argv[1])
+    else:
+        hyperliquid_frames, bybit_frames = synthetic_frames()
+    print(f"json backend: {json_backend}")
+    for name, rate in benchmark(hyperliquid_frames, bybit_frames).items():
+        print(f"{name:<32} {rate:>12,.0f} frames/sec")
@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+
+class ConflatingHandoff:
+    '''
+    Bounded handoff from producer threads (pybit callbacks) and the event loop into a
+    single asyncio consumer. Items are keyed, e.g. ('bybit', 'BTC', 50): while a key is
+    still waiting, a newer item is folded into it with merge(older, newer) (or replaces it
+    when merge is None), so a burst costs one pending slot per key. The loop is only woken
+    when the buffer goes from idle to non-empty. Past capacity a new key is dropped, unless
+    it is put with lossless=True: book deltas cannot be skipped without corrupting the local
+    book, and one slot per key already bounds them by the subscription count.
+    '''
+    def __init__(self, capacity=4096):
+        self.capacity = capacity  # max distinct pending keys, keep it above the subscription count
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._signalled = False
+        self._event = asyncio.Event()
+        self._loop = None
+        self.received = 0
+        self.conflated = 0
+        self.dropped = 0
+        self.overflowed = 0  # lossless items accepted past capacity
+        self.delivered = 0
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def put(self, key, item, merge=None, lossless=False):
+        # safe to call from any thread, False when the item was dropped
+        with self._lock:
+            self.received += 1
+            pending = self._pending
+            if key in pending:
+                pending[key] = merge(pending[key], item) if merge is not None else item
+                self.conflated += 1
+                return True
+            if len(pending) >= self.capacity:
+                if not lossless:
+                    self.dropped += 1
+                    return False
+                self.overflowed += 1
+            pending[key] = item
+            wake = not self._signalled
+            self._signalled = True
+        if wake:
+            self._loop.call_soon_threadsafe(self._event.set)
+        return True
+
+    async def get_batch(self):
+        '''Waits until something is pending and returns {key: item} for everything pending.'''
+        while True:
+            with self._lock:
+                batch = self._pending
+                self._signalled = False
+                if batch:
+                    self._pending = {}
+                    self.delivered += len(batch)
+                    return batch
+            self._event.clear()
+            await self._event.wait()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stats(self):
+        return {
+            'received': self.received,
+            'delivered': self.delivered,
+            'conflated': self.conflated,
+            'dropped': self.dropped,
+            'overflowed': self.overflowed,
+            'pending': len(self._pending),
+        }
@@ -11,7 +11,8 @@ import config
 import hmac
 import base64
 from pybit.unified_trading import WebSocket
-from byBitHyperLiquid import rate_limiter, get_current_time_ms, get_current_utc_time_with_ms, get_top_n, calculate_impact_price, process_data, update_local_orderbook, latest_data
+from decoder import decode_hyperliquid_l2book
+from byBitHyperLiquid import get_current_time_ms, get_current_utc_time_with_ms, get_top_n, calculate_impact_price, process_data, update_local_orderbook, latest_data
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s %(levelname)s:%(message)s',
@@ -74,18 +75,7 @@ def process_hyperliquid_message(symbol, stream_type, message):
     if 'data' in data:
         if 'levels' in data["data"]:
             # print(data["data"])
-            levels = data["data"]["levels"]
-            bids = levels[0] # [{'px': '97403', 'sz':'4.6913', 'n':'10'}]
-            asks = levels[1] #[{'px': '97403', 'sz':'4.6913', 'n':'10'}]
-            # print("bids:", bids)
-            # print("asks:", asks)
-            bids = [[float(bid['px']), float(bid['sz'])] for bid in bids]
-            asks = [[float(ask['px']), float(ask['sz'])] for ask in asks]
-            new_data = {
-                'time': data['data']['time'],
-                'bids': bids,
-                'asks': asks
-            }
+            new_data = decode_hyperliquid_l2book(data) # [{'px': '97403', 'sz':'4.6913', 'n':'10'}] -> [(97403.0, 4.6913)]
             latest_data[symbol]['hyperliquid'][stream_type] = new_data
             update_local_orderbook(symbol, stream_type, new_data)
             # print(latest_data)
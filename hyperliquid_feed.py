@@ -0,0 +1,125 @@
+import asyncio
+import json
+import logging
+import random
+import websockets
+from decoder import loads
+from latency import receive_stamp, stamp_receive
+
+
+class HyperliquidSession:
+    '''
+    One Hyperliquid websocket carrying every subscription (l2Book, trades, bbo, ...) for
+    every coin. Frames are parsed once and routed by (channel, coin) to the handler of that
+    subscription, handler(stream_type, frame); the channel is the subscription type.
+    After a disconnect all subscriptions are sent again in one batch, with exponential
+    backoff between attempts instead of a fixed sleep.
+    '''
+    def __init__(self, ws_url, ping_interval=50, min_backoff=0.5, max_backoff=30, raw_callback=None):
+        self.ws_url = ws_url
+        self.raw_callback = raw_callback  # raw_callback(venue, raw) sees every frame before parsing
+        self.ping_interval = ping_interval  # hyperliquid drops connections that stay silent for 60s
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.subscriptions = {}  # (stream_type, coin) -> subscription dict
+        self.handlers = {}  # (stream_type, coin) -> handler(stream_type, frame)
+        self.websocket = None
+        self.reconnects = 0
+        self.unrouted = 0
+
+    async def subscribe(self, stream_type, coin, handler=None):
+        key = (stream_type, coin)
+        if handler is not None:
+            self.handlers[key] = handler
+        if key in self.subscriptions:
+            return
+        subscription = {"type": stream_type, "coin": coin}
+        self.subscriptions[key] = subscription
+        if self.websocket is not None:
+            await self.websocket.send(json.dumps({"method": "subscribe", "subscription": subscription}))
+
+    async def unsubscribe(self, stream_type, coin):
+        subscription = self.subscriptions.pop((stream_type, coin), None)
+        self.handlers.pop((stream_type, coin), None)
+        if subscription is None:
+            return
+        if self.websocket is not None:
+            await self.websocket.send(json.dumps({"method": "unsubscribe", "subscription": subscription}))
+
+    async def _subscribe_all(self, websocket):
+        # queue every subscribe frame back to back, the acks are handled by the receive loop
+        for subscription in list(self.subscriptions.values()):
+            await websocket.send(json.dumps({"method": "subscribe", "subscription": subscription}))
+        logging.info(f"Hyperliquid: subscribed {len(self.subscriptions)} streams for {len(self.coins())} coins")
+
+    async def _heartbeat(self, websocket):
+        while True:
+            await asyncio.sleep(self.ping_interval)
+            await websocket.send(json.dumps({"method": "ping"}))
+
+    def dispatch(self, message):
+        stamp = receive_stamp()
+        if self.raw_callback is not None:
+            self.raw_callback('hyperliquid', message)
+        frame = stamp_receive(loads(message), stamp)
+        stream_type = frame.get('channel')
+        data = frame.get('data')
+        if stream_type in ('subscriptionResponse', 'pong') or data is None:
+            return
+        if isinstance(data, list):
+            # trades arrive as a list of fills for one coin
+            coin = data[0].get('coin') if data else None
+        else:
+            coin = data.get('coin')
+        handler = self.handlers.get((stream_type, coin))
+        if handler is None:
+            self.unrouted += 1
+            return
+        handler(stream_type, frame)
+
+    def coins(self):
+        return {coin for _, coin in self.subscriptions}
+
+    def backoff(self, attempt):
+        delay = min(self.max_backoff, self.min_backoff * 2 ** attempt)
+        return delay * random.uniform(0.5, 1.0)
+
+    async def run(self):
+        attempt = 0
+        while True:
+            heartbeat = None
+            try:
+                async with websockets.connect(self.ws_url) as websocket:
+                    logging.info(f'Connected to {self.ws_url}')
+                    self.websocket = websocket
+                    await self._subscribe_all(websocket)
+                    heartbeat = asyncio.create_task(self._heartbeat(websocket))
+                    async for message in websocket:
+                        attempt = 0
+                        try:
+                            self.dispatch(message)
+                        except Exception as e:
+                            logging.error(f"Error processing Hyperliquid message: {e}")
+                            logging.debug(f"Problematic message: {message}")
+            except websockets.exceptions.ConnectionClosed:
+                logging.warning("Hyperliquid WebSocket connection closed. Reconnecting...")
+            except Exception as e:
+                logging.error(f"Error in Hyperliquid WebSocket: {e}")
+            finally:
+                self.websocket = None
+                if heartbeat is not None:
+                    heartbeat.cancel()
+            delay = self.backoff(attempt)
+            attempt += 1
+            self.reconnects += 1
+            logging.info(f"Reconnecting to Hyperliquid WebSocket in {delay:.1f}s...")
+            await asyncio.sleep(delay)
+
+    def stats(self):
+        return {
+            'connected': self.websocket is not None,
+            'subscriptions': len(self.subscriptions),
+            'coins': len(self.coins()),
+            'reconnects': self.reconnects,
+            'unrouted': self.unrouted,
+        }
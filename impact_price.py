@@ -0,0 +1,90 @@
+import numpy as np
+
+impact_notionals = [100, 1000, 10000, 100000]  # USD sizes reported on every tick
+
+
+class DepthCurve:
+    '''
+    Cumulative notional/quantity prefix arrays for one book side (best level first).
+    The impact price for notional x is x divided by the quantity needed to fill x,
+    found for a whole ladder of notionals with one searchsorted over the prefix sums.
+    '''
+    def __init__(self, book_side=None):
+        self.book_side = book_side
+        self.version = None
+        self.prices = np.empty(0)
+        self.cum_notional = np.empty(0)
+        self.cum_quantity = np.empty(0)
+
+    def load(self, prices, sizes):
+        prices = np.asarray(prices, dtype=np.float64)
+        sizes = np.asarray(sizes, dtype=np.float64)
+        self.prices = prices
+        self.cum_notional = np.cumsum(prices * sizes)
+        self.cum_quantity = np.cumsum(sizes)
+
+    def refresh(self):
+        # rebuild the prefix arrays only when the underlying BookSide has changed
+        if self.book_side is not None and self.version != self.book_side.version:
+            self.load(*self.book_side.levels())
+            self.version = self.book_side.version
+        return self
+
+    def impact_prices(self, notionals):
+        '''
+        Returns an array of impact prices aligned with notionals, NaN where the side
+        does not hold enough depth to fill that notional.
+        '''
+        notionals = np.asarray(notionals, dtype=np.float64)
+        n = len(self.prices)
+        if n == 0:
+            return np.full(notionals.shape, np.nan)
+        # first level at which the accumulated notional reaches each target
+        idx = np.searchsorted(self.cum_notional, notionals, side='left')
+        reached = idx < n
+        idx = np.minimum(idx, n - 1)
+        prev_notional = np.where(idx > 0, self.cum_notional[idx - 1], 0.0)
+        prev_quantity = np.where(idx > 0, self.cum_quantity[idx - 1], 0.0)
+        remaining_quantity = (notionals - prev_notional) / self.prices[idx]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            impact = notionals / (prev_quantity + remaining_quantity)
+        return np.where(reached, impact, np.nan)
+
+
+class BookImpact:
+    '''Bid and ask DepthCurves kept in sync with one OrderBook.'''
+    def __init__(self, book):
+        self.book = book
+        self.bids = DepthCurve(book.bids)
+        self.asks = DepthCurve(book.asks)
+
+    def impact_prices(self, notionals):
+        return self.bids.refresh().impact_prices(notionals), self.asks.refresh().impact_prices(notionals)
+
+
+def _to_optional(value):
+    return None if np.isnan(value) else float(value)
+
+
+def impact_ladder(hyperliquid, bybit, notionals=impact_notionals):
+    '''
+    Impact prices on both venues and the entry/exit spreads between them for every
+    notional in the ladder. hyperliquid and bybit are BookImpact objects. Returns
+    {notional: {...}} with None wherever a side could not fill the notional.
+    '''
+    impact_bid_hyperliquid, impact_ask_hyperliquid = hyperliquid.impact_prices(notionals)
+    impact_bid_bybit, impact_ask_bybit = bybit.impact_prices(notionals)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        entry_spread = np.round(100 * (impact_bid_hyperliquid - impact_ask_bybit) / impact_ask_bybit, 4)
+        exit_spread = np.round(100 * (impact_ask_hyperliquid - impact_bid_bybit) / impact_bid_bybit, 4)
+    ladder = {}
+    for i, notional in enumerate(notionals):
+        ladder[notional] = {
+            'impact_bid_price_hyperliquid': _to_optional(impact_bid_hyperliquid[i]),
+            'impact_ask_price_hyperliquid': _to_optional(impact_ask_hyperliquid[i]),
+            'impact_bid_price_bybit': _to_optional(impact_bid_bybit[i]),
+            'impact_ask_price_bybit': _to_optional(impact_ask_bybit[i]),
+            'entry_spread': _to_optional(entry_spread[i]),
+            'exit_spread': _to_optional(exit_spread[i]),
+        }
+    return ladder
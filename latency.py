@@ -0,0 +1,195 @@
+import asyncio
+import json
+import logging
+import time
+
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_HALF = 1 << (SUB_BUCKET_BITS - 1)
+MAX_MAGNITUDE = 40  # values up to ~2^47 ns (~39 hours) before clamping
+
+stages = ('exchange', 'handoff', 'decode', 'book', 'compute', 'enqueue', 'redis', 'end_to_end')
+
+
+def receive_stamp():
+    '''Taken as soon as a raw frame arrives, before parsing: (monotonic ns, wall ns).'''
+    return time.monotonic_ns(), time.time_ns()
+
+
+def stamp_receive(message, stamp):
+    '''
+    Attaches a receive_stamp() to the parsed frame: monotonic ns for in-process stages, wall
+    ns for the exchange hop, and the time spent parsing since, which counts as 'decode'.
+    '''
+    message['_recv_ns'], message['_recv_wall_ns'] = stamp
+    message['_parse_ns'] = time.monotonic_ns() - stamp[0]
+    return message
+
+
+class LatencyHistogram:
+    '''
+    HDR-style log-linear histogram of nanosecond values: exact below 128 ns, then 64
+    buckets per power of two, so every recorded value is kept within ~1.6%. Recording is
+    one bit_length and one list increment.
+    '''
+    def __init__(self):
+        self.counts = [0] * ((MAX_MAGNITUDE + 2) * SUB_BUCKET_HALF)
+        self.total = 0
+        self.max = 0
+
+    @staticmethod
+    def _index(value):
+        magnitude = value.bit_length() - SUB_BUCKET_BITS
+        if magnitude <= 0:
+            return value
+        magnitude = min(magnitude, MAX_MAGNITUDE)
+        return magnitude * SUB_BUCKET_HALF + min(value >> magnitude, 2 * SUB_BUCKET_HALF - 1)
+
+    @staticmethod
+    def _value(index):
+        if index < 2 * SUB_BUCKET_HALF:
+            return index
+        magnitude = index // SUB_BUCKET_HALF - 1
+        return (index - magnitude * SUB_BUCKET_HALF) << magnitude
+
+    def record(self, value):
+        if value < 0:
+            value = 0
+        self.counts[self._index(value)] += 1
+        self.total += 1
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q):
+        if not self.total:
+            return 0
+        target = max(1, int(round(self.total * q / 100.0)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count:
+                seen += count
+                if seen >= target:
+                    return min(self._value(index), self.max)
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.total,
+            'p50_us': round(self.percentile(50) / 1000, 1),
+            'p99_us': round(self.percentile(99) / 1000, 1),
+            'p99.9_us': round(self.percentile(99.9) / 1000, 1),
+            'max_us': round(self.max / 1000, 1),
+        }
+
+    def merge(self, other):
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def export(self):
+        # sparse form that pickles/serializes small, for shipping histograms between processes
+        return {'counts': {index: count for index, count in enumerate(self.counts) if count}, 'max': self.max}
+
+    def merge_export(self, exported):
+        for index, count in exported['counts'].items():
+            self.counts[int(index)] += count
+            self.total += count
+        self.max = max(self.max, exported['max'])
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.total = 0
+        self.max = 0
+
+
+class LatencyRecorder:
+    '''Per-stage, per-symbol, per-venue histograms. Only touched from the event loop thread.'''
+    def __init__(self):
+        self.histograms = {}  # (stage, symbol, venue) -> LatencyHistogram
+        self.last_update = {}  # symbol -> (receive ns, book applied ns) of its latest update
+
+    def record(self, stage, symbol, venue, value_ns):
+        key = (stage, symbol, venue)
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = self.histograms[key] = LatencyHistogram()
+        histogram.record(int(value_ns))
+
+    def record_exchange(self, symbol, venue, message, exchange_ts_ms):
+        recv_wall_ns = message.get('_recv_wall_ns')
+        if recv_wall_ns is not None and exchange_ts_ms:
+            self.record('exchange', symbol, venue, recv_wall_ns - int(exchange_ts_ms) * 1000000)
+
+    def record_update(self, symbol, venue, message, exchange_ts_ms, start_ns, decoded_ns, applied_ns):
+        # one book update: exchange -> receive, receive -> consumer (handoff), JSON parse + decode, book apply
+        self.record_exchange(symbol, venue, message, exchange_ts_ms)
+        recv_ns = message.get('_recv_ns')
+        parse_ns = message.get('_parse_ns', 0)
+        if recv_ns is not None:
+            self.record('handoff', symbol, venue, start_ns - recv_ns - parse_ns)
+        else:
+            recv_ns = start_ns
+        self.record('decode', symbol, venue, decoded_ns - start_ns + parse_ns)
+        self.record('book', symbol, venue, applied_ns - decoded_ns)
+        self.last_update[symbol] = (recv_ns, applied_ns)
+
+    def record_compute(self, symbol, computed_ns, enqueued_ns):
+        # measured from the latest book update, so scheduler coalescing delay shows up in 'compute';
+        # 'enqueue' is the top-of-book write and the hand-off to the redis publisher, whose
+        # write is timed separately as 'redis' when its pipeline executes
+        last = self.last_update.get(symbol)
+        if last is None:
+            return
+        recv_ns, applied_ns = last
+        self.record('compute', symbol, 'combined', computed_ns - applied_ns)
+        self.record('enqueue', symbol, 'combined', enqueued_ns - computed_ns)
+        self.record('end_to_end', symbol, 'combined', enqueued_ns - recv_ns)
+
+    def combined(self, stage, venue=None):
+        # one histogram for a stage across every symbol (and venue unless given)
+        histogram = LatencyHistogram()
+        for (key_stage, _, key_venue), other in self.histograms.items():
+            if key_stage == stage and venue in (None, key_venue):
+                histogram.merge(other)
+        return histogram
+
+    def summary(self):
+        return {f'{stage}:{symbol}:{venue}': histogram.summary()
+                for (stage, symbol, venue), histogram in sorted(self.histograms.items())}
+
+    def reset(self):
+        for histogram in self.histograms.values():
+            histogram.reset()
+
+
+async def publish_latency(recorder, redis_client, key='feed_latency', interval=10):
+    # one hash field per stage:symbol:venue with its percentile summary as JSON
+    while True:
+        await asyncio.sleep(interval)
+        summary = recorder.summary()
+        if not summary:
+            continue
+        try:
+            await redis_client.hset(key, mapping={field: json.dumps(value) for field, value in summary.items()})
+        except Exception as e:
+            logging.error(f"Failed to publish latency histograms to {key}: {e}")
+
+
+async def serve_latency(recorder, host='127.0.0.1', port=8790):
+    '''Minimal local HTTP endpoint: any GET returns the histogram summary as JSON.'''
+    async def handle(reader, writer):
+        try:
+            await reader.readuntil(b'\r\n\r\n')
+            body = json.dumps(recorder.summary()).encode()
+            writer.write(b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\n'
+                         b'Content-Length: ' + str(len(body)).encode() + b'\r\nConnection: close\r\n\r\n' + body)
+            await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+    server = await asyncio.start_server(handle, host, port)
+    logging.info(f"Latency histograms served on http://{host}:{port}/")
+    async with server:
+        await server.serve_forever()
@@ -0,0 +1,143 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+import websockets
+
+
+async def sim_request(url, request):
+    async with websockets.connect(url) as websocket:
+        await websocket.send(json.dumps(request))
+        async for message in websocket:
+            response = json.loads(message)
+            if response.get('op') == request['op']:
+                return response
+
+
+async def wait_for_port(url, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            return await sim_request(url, {'op': 'sim_stats'})
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            await asyncio.sleep(0.1)
+
+
+async def run_load_test(symbol_count=20, rates=(5, 10, 20, 50, 100, 200), step_seconds=10, settle_seconds=2,
+                        depths=(50,), host='127.0.0.1', bybit_port=8801, hyperliquid_port=8802, p99_limit_ms=50.0,
+                        compute_interval=None):
+    '''
+    Starts simulator.py in its own process, points the collector at it with symbol_count
+    synthetic coins, and steps the per-stream message rate through `rates`. For each step it
+    reports the offered and processed rates, CPU per message (every thread of this process,
+    so pybit's included) and end-to-end latency percentiles. A step is sustained when at
+    least 95% of the target rate arrived and end-to-end p99 stayed under p99_limit_ms. End
+    to end includes the scheduler's coalescing wait, pass compute_interval to change it.
+    '''
+    bybit_url = f'ws://{host}:{bybit_port}/v5/public/linear'
+    hyperliquid_url = f'ws://{host}:{hyperliquid_port}'
+    simulator = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'simulator.py'),
+                                  '--host', host, '--bybit-port', str(bybit_port), '--hyperliquid-port', str(hyperliquid_port),
+                                  '--rate', str(rates[0])])
+    tasks = []
+    try:
+        await wait_for_port(bybit_url)
+        await wait_for_port(hyperliquid_url)
+
+        import byBitHyperLiquid as collector
+        loop = asyncio.get_running_loop()
+        coins = [f'SIM{i:03d}' for i in range(symbol_count)]
+        collector.bybit_ws_url = bybit_url
+        collector.bybit_stream_types = list(depths)
+        collector.default_bybit_stream = depths[0]
+        collector.tick_dumper.sampler = None  # no per-symbol text dumps while measuring
+        for symbol in list(collector.latest_data):
+            del collector.latest_data[symbol]
+        for coin in coins:
+            collector.add_symbol_state(coin)
+        collector.feed_handoff.bind(loop)
+        collector.compute_scheduler.bind(loop)
+        if compute_interval is not None:
+            collector.compute_scheduler.default_interval = compute_interval
+        # redis_publisher.run is not started, snapshots stay in its bounded buffers
+        tasks = [asyncio.create_task(collector.feed_consumer()),
+                 asyncio.create_task(collector.bybit_websocket_handler(coins, list(depths), stats_interval=3600)),
+                 asyncio.create_task(collector.hyperliquid_websocket_handler(hyperliquid_url, coins, ['l2Book']))]
+        streams = symbol_count * (len(depths) + 1)
+        while not all(collector.latest_data[coin]['local_orderbook'].is_ready() and
+                      collector.latest_data[coin]['bybit'][depths[0]].is_ready() for coin in coins):
+            await asyncio.sleep(0.2)
+        logging.info(f"Load test: {symbol_count} symbols, {streams} streams, all books ready")
+
+        results = []
+        for rate in rates:
+            await sim_request(bybit_url, {'op': 'sim_rate', 'rate': rate})
+            await sim_request(hyperliquid_url, {'op': 'sim_rate', 'rate': rate})
+            await asyncio.sleep(settle_seconds)
+            collector.latency_recorder.reset()
+            received = collector.feed_handoff.received
+            delivered = collector.feed_handoff.delivered
+            runs = collector.compute_scheduler.runs
+            cpu = time.process_time()
+            started = time.perf_counter()
+            await asyncio.sleep(step_seconds)
+            elapsed = time.perf_counter() - started
+            cpu = time.process_time() - cpu
+            received = collector.feed_handoff.received - received
+            delivered = collector.feed_handoff.delivered - delivered
+            end_to_end = collector.latency_recorder.combined('end_to_end').summary()
+            result = {
+                'rate_per_stream': rate,
+                'target_msgs_per_sec': rate * streams,
+                'received_msgs_per_sec': round(received / elapsed),
+                'processed_msgs_per_sec': round(delivered / elapsed),
+                'computes_per_sec': round((collector.compute_scheduler.runs - runs) / elapsed),
+                'cpu_us_per_msg': round(cpu / received * 1e6, 1) if received else None,
+                'cpu_percent': round(100 * cpu / elapsed, 1),
+                'e2e_p50_ms': round(end_to_end['p50_us'] / 1000, 3),
+                'e2e_p99_ms': round(end_to_end['p99_us'] / 1000, 3),
+                'e2e_p99.9_ms': round(end_to_end['p99.9_us'] / 1000, 3),
+                'exchange_p99_ms': round(collector.latency_recorder.combined('exchange').summary()['p99_us'] / 1000, 3),
+            }
+            result['sustained'] = (received >= 0.95 * rate * streams * elapsed and end_to_end['p99_us'] < p99_limit_ms * 1000)
+            results.append(result)
+            logging.info(f"Load test step: {result}")
+        return results
+    finally:
+        for task in tasks:
+            task.cancel()
+        # the bybit handler closes its pybit sockets on cancel, before the simulator goes away
+        await asyncio.gather(*tasks, return_exceptions=True)
+        simulator.terminate()
+        simulator.wait()
+
+
+def report(results):
+    columns = list(results[0])
+    print(' '.join(f'{column:>22}' for column in columns))
+    for result in results:
+        print(' '.join(f'{str(result[column]):>22}' for column in columns))
+    sustained = [result['received_msgs_per_sec'] for result in results if result['sustained']]
+    print(f"max sustained: {max(sustained) if sustained else 0} msgs/sec")
+
+
+if __name__ == "__main__":
+    # python load_test.py --symbols 50 --rates 5,10,20,50,100 --step 10
+    parser = argparse.ArgumentParser(description="Throughput and latency of the full feed pipeline against simulator.py")
+    parser.add_argument('--symbols', type=int, default=20)
+    parser.add_argument('--rates', default='5,10,20,50,100,200', help="messages per second per stream, one step each")
+    parser.add_argument('--depths', default='50', help="bybit depths subscribed per symbol")
+    parser.add_argument('--step', type=float, default=10, help="seconds measured per step")
+    parser.add_argument('--p99-limit-ms', type=float, default=50.0)
+    parser.add_argument('--compute-interval', type=float, default=None, help="scheduler interval, default keeps compute_interval")
+    args = parser.parse_args()
+    results = asyncio.run(run_load_test(args.symbols, [float(rate) for rate in args.rates.split(',')], args.step,
+                                        depths=[int(depth) for depth in args.depths.split(',')], p99_limit_ms=args.p99_limit_ms,
+                                        compute_interval=args.compute_interval))
+    report(results)
@@ -0,0 +1,228 @@
+import asyncio
+import logging
+import time
+import aiohttp
+from decoder import loads
+
+hyperliquid_info_url = "https://api.hyperliquid.xyz/info"
+bybit_instruments_url = "https://api.bybit.com/v5/market/instruments-info"
+bybit_tickers_url = "https://api.bybit.com/v5/market/tickers"
+
+
+class MetadataError(Exception):
+    pass
+
+
+class AssetContext:
+    '''One Hyperliquid perp from metaAndAssetCtxs. open_interest is in coins, day_volume in USD.'''
+    __slots__ = ('coin', 'funding', 'open_interest', 'day_volume', 'mark_price', 'delisted')
+
+    def __init__(self, coin, funding, open_interest, day_volume, mark_price, delisted=False):
+        self.coin = coin
+        self.funding = funding
+        self.open_interest = open_interest
+        self.day_volume = day_volume
+        self.mark_price = mark_price
+        self.delisted = delisted
+
+    @property
+    def open_interest_usd(self):
+        return self.open_interest * self.mark_price
+
+    def __repr__(self):
+        return (f"AssetContext({self.coin}, funding={self.funding}, open_interest={self.open_interest}, "
+                f"day_volume={self.day_volume}, mark_price={self.mark_price})")
+
+
+class BybitInstrument:
+    __slots__ = ('symbol', 'base_coin', 'quote_coin', 'status', 'contract_type')
+
+    def __init__(self, symbol, base_coin, quote_coin, status, contract_type):
+        self.symbol = symbol
+        self.base_coin = base_coin
+        self.quote_coin = quote_coin
+        self.status = status
+        self.contract_type = contract_type
+
+    def __repr__(self):
+        return f"BybitInstrument({self.symbol}, {self.status}, {self.contract_type})"
+
+
+class BybitTicker:
+    __slots__ = ('symbol', 'last_price', 'mark_price', 'funding_rate', 'open_interest', 'turnover_24h')
+
+    def __init__(self, symbol, last_price, mark_price, funding_rate, open_interest, turnover_24h):
+        self.symbol = symbol
+        self.last_price = last_price
+        self.mark_price = mark_price
+        self.funding_rate = funding_rate
+        self.open_interest = open_interest
+        self.turnover_24h = turnover_24h
+
+    def __repr__(self):
+        return f"BybitTicker({self.symbol}, last={self.last_price}, mark={self.mark_price}, funding={self.funding_rate})"
+
+
+def _float(value):
+    return float(value) if value not in (None, '') else float('nan')
+
+
+class MetadataClient:
+    '''
+    Async client for the venues' REST metadata, shared by the collector (symbol universe) and
+    the trends job. One pooled aiohttp session per event loop, a per-request timeout, and a
+    TTL cache: a result younger than ttl is returned without a request, concurrent callers of
+    the same request share one in-flight fetch, and when a refresh fails a result up to
+    max_stale old is served instead (raising MetadataError only without one).
+    '''
+    def __init__(self, ttl=30.0, timeout=10.0, max_stale=600.0, connections=10):
+        self.ttl = ttl
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.max_stale = max_stale
+        self.connections = connections
+        self.session = None
+        self.loop = None
+        self.cache = {}  # key -> (monotonic time fetched, result)
+        self.inflight = {}  # key -> task
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+        self.errors = 0
+        self.stale = 0
+
+    def _session(self):
+        loop = asyncio.get_running_loop()
+        if self.session is None or self.session.closed or self.loop is not loop:
+            # a session is bound to the loop it was created on
+            self._discard()
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connections, ttl_dns_cache=300), timeout=self.timeout)
+            self.loop = loop
+        return self.session
+
+    def _discard(self):
+        '''
+        Drop a session owned by another loop. That loop is not the running one, so the session's
+        close() coroutine cannot be awaited here: if the loop is running in another thread the
+        close is handed to it, otherwise the connector's sockets are closed directly.
+        '''
+        session, loop = self.session, self.loop
+        self.session = self.loop = None
+        if session is None or session.closed:
+            return
+        if loop is not None and loop.is_running() and not loop.is_closed():
+            asyncio.run_coroutine_threadsafe(session.close(), loop)
+            return
+        connector = session.connector
+        session.detach()
+        if connector is not None and not connector.closed:
+            connector._close()
+
+    async def _request(self, method, url, **kwargs):
+        self.requests += 1
+        async with self._session().request(method, url, **kwargs) as resp:
+            body = await resp.read()
+            if resp.status != 200:
+                raise MetadataError(f"{method} {url} failed with status code {resp.status}: {body[:200]!r}")
+            return loads(body)
+
+    async def _fill(self, key, fetch):
+        result = await fetch()
+        self.cache[key] = (time.monotonic(), result)
+        return result
+
+    async def _cached(self, key, fetch):
+        now = time.monotonic()
+        entry = self.cache.get(key)
+        if entry is not None and now - entry[0] < self.ttl:
+            self.hits += 1
+            return entry[1]
+        task = self.inflight.get(key)
+        if task is None or task.get_loop() is not asyncio.get_running_loop():
+            task = self.inflight[key] = asyncio.ensure_future(self._fill(key, fetch))
+            task.add_done_callback(lambda done: self.inflight.pop(key) if self.inflight.get(key) is done else None)
+        else:
+            self.coalesced += 1
+        try:
+            # shield: one caller being cancelled must not cancel the fetch the others wait on
+            return await asyncio.shield(task)
+        except Exception as e:
+            self.errors += 1
+            if entry is not None and now - entry[0] < self.max_stale:
+                self.stale += 1
+                logging.warning(f"Metadata {key} refresh failed, serving {now - entry[0]:.0f}s old result: {e!r}")
+                return entry[1]
+            raise MetadataError(f"Metadata {key} unavailable: {e!r}") from e
+
+    async def _fetch_asset_contexts(self):
+        response = await self._request('POST', hyperliquid_info_url, json={"type": "metaAndAssetCtxs"})
+        try:
+            universe, contexts = response[0]['universe'], response[1]
+            return {asset['name']: AssetContext(asset['name'], _float(ctx.get('funding')), _float(ctx.get('openInterest')),
+                                                _float(ctx.get('dayNtlVlm')), _float(ctx.get('markPx')), bool(asset.get('isDelisted')))
+                    for asset, ctx in zip(universe, contexts)}
+        except (KeyError, IndexError, TypeError) as e:
+            raise MetadataError(f"Unexpected metaAndAssetCtxs payload: {e!r}") from e
+
+    async def hyperliquid_asset_contexts(self):
+        '''coin -> AssetContext for every Hyperliquid perp, delisted ones included.'''
+        return await self._cached('hyperliquid_asset_contexts', self._fetch_asset_contexts)
+
+    async def hyperliquid_coins(self):
+        return {coin for coin, ctx in (await self.hyperliquid_asset_contexts()).items() if not ctx.delisted}
+
+    async def _bybit_list(self, url, params):
+        items = []
+        cursor = ''
+        while True:
+            body = await self._request('GET', url, params={**params, 'cursor': cursor})
+            if body.get('retCode') != 0:
+                raise MetadataError(f"Bybit {url} failed: {body.get('retMsg')}")
+            items.extend(body['result']['list'])
+            cursor = body['result'].get('nextPageCursor')
+            if not cursor:
+                return items
+
+    async def bybit_instruments(self, category='linear'):
+        async def fetch():
+            return [BybitInstrument(item['symbol'], item.get('baseCoin'), item.get('quoteCoin'), item.get('status'), item.get('contractType'))
+                    for item in await self._bybit_list(bybit_instruments_url, {'category': category, 'limit': 1000})]
+        return await self._cached(f'bybit_instruments_{category}', fetch)
+
+    async def bybit_linear_coins(self):
+        '''Base coins of the trading USDT linear perpetuals.'''
+        return {instrument.symbol[:-4] for instrument in await self.bybit_instruments('linear')
+                if instrument.status == 'Trading' and instrument.contract_type == 'LinearPerpetual' and instrument.symbol.endswith('USDT')}
+
+    async def bybit_tickers(self, category='linear'):
+        '''symbol -> BybitTicker'''
+        async def fetch():
+            body = await self._request('GET', bybit_tickers_url, params={'category': category})
+            if body.get('retCode') != 0:
+                raise MetadataError(f"Bybit tickers failed: {body.get('retMsg')}")
+            return {item['symbol']: BybitTicker(item['symbol'], _float(item.get('lastPrice')), _float(item.get('markPrice')),
+                                                _float(item.get('fundingRate')), _float(item.get('openInterest')),
+                                                _float(item.get('turnover24h')))
+                    for item in body['result']['list']}
+        return await self._cached(f'bybit_tickers_{category}', fetch)
+
+    async def close(self):
+        if self.loop is not asyncio.get_running_loop():
+            self._discard()
+            return
+        session = self.session
+        self.session = self.loop = None
+        if session is not None and not session.closed:
+            await session.close()
+
+    def stats(self):
+        return {
+            'requests': self.requests,
+            'cache_hits': self.hits,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'stale_served': self.stale,
+        }
+
+
+metadata_client = MetadataClient()  # shared per process
@@ -0,0 +1,176 @@
+import random
+import time
+from bisect import bisect_left, insort
+
+
+class BookSide:
+    '''
+    One side of an L2 book kept as a sorted price array plus a price -> size dict.
+    Bid keys are stored negated so index 0 is always the best level on both sides.
+    '''
+    def __init__(self, is_bid, max_depth=None):
+        self.is_bid = is_bid
+        self.max_depth = max_depth
+        self._keys = []  # sorted ascending, best level first
+        self._sizes = {}  # price -> size
+        self.version = 0  # bumped on every mutation so derived arrays know when to rebuild
+
+    def __len__(self):
+        return len(self._keys)
+
+    def clear(self):
+        self._keys = []
+        self._sizes = {}
+        self.version += 1
+
+    def load(self, levels):
+        # snapshot: one sort for the whole side instead of one insert per level
+        sizes = {}
+        for price, size in levels:
+            size = float(size)
+            if size:
+                sizes[float(price)] = size
+        self._sizes = sizes
+        if self.is_bid:
+            self._keys = sorted(-price for price in sizes)
+        else:
+            self._keys = sorted(sizes)
+        self._trim()
+        self.version += 1
+
+    def set_level(self, price, size):
+        price = float(price)
+        size = float(size)
+        key = -price if self.is_bid else price
+        self.version += 1
+        if size == 0:
+            if self._sizes.pop(price, None) is not None:
+                del self._keys[bisect_left(self._keys, key)]
+            return
+        if price not in self._sizes:
+            insort(self._keys, key)
+        self._sizes[price] = size
+
+    def apply(self, levels):
+        for price, size in levels:
+            self.set_level(price, size)
+        self._trim()
+
+    def _trim(self):
+        # bybit keeps the book at a fixed depth, levels pushed past it are dropped
+        if self.max_depth is not None and len(self._keys) > self.max_depth:
+            sign = -1 if self.is_bid else 1
+            for key in self._keys[self.max_depth:]:
+                del self._sizes[sign * key]
+            del self._keys[self.max_depth:]
+
+    def best(self):
+        if not self._keys:
+            return None
+        price = -self._keys[0] if self.is_bid else self._keys[0]
+        return price, self._sizes[price]
+
+    def top_n(self, n=5):
+        sizes = self._sizes
+        if self.is_bid:
+            return [(-key, sizes[-key]) for key in self._keys[:n]]
+        return [(key, sizes[key]) for key in self._keys[:n]]
+
+    def levels(self):
+        # all levels best first, as parallel price and size lists
+        sizes = self._sizes
+        prices = [-key for key in self._keys] if self.is_bid else list(self._keys)
+        return prices, [sizes[price] for price in prices]
+
+
+class OrderBook:
+    '''
+    Per-symbol, per-venue L2 book. Snapshots replace both sides, deltas are applied
+    level by level in O(log n) lookups, and top-N reads slice the already sorted arrays.
+    '''
+    def __init__(self, symbol, venue, max_depth=None):
+        self.symbol = symbol
+        self.venue = venue
+        self.max_depth = max_depth
+        self.bids = BookSide(True, max_depth)
+        self.asks = BookSide(False, max_depth)
+        self.time = None  # exchange timestamp (ms) of the last applied update
+        self.update_id = None
+
+    def __repr__(self):
+        return f"OrderBook({self.symbol}, {self.venue}, bid={self.best_bid()}, ask={self.best_ask()}, time={self.time})"
+
+    def apply_snapshot(self, bids, asks, ts, update_id=None):
+        self.bids.load(bids)
+        self.asks.load(asks)
+        self.time = ts
+        self.update_id = update_id
+
+    def apply_delta(self, bids, asks, ts, update_id=None):
+        self.bids.apply(bids)
+        self.asks.apply(asks)
+        self.time = ts
+        self.update_id = update_id
+
+    def apply_update(self, update):
+        # decoder.BookUpdate: 'snapshot' resets the book, 'delta' patches it
+        if update.kind == 'delta':
+            self.apply_delta(update.bids, update.asks, update.time, update.update_id)
+        else:
+            self.apply_snapshot(update.bids, update.asks, update.time, update.update_id)
+
+    def is_ready(self):
+        return self.time is not None
+
+    def best_bid(self):
+        return self.bids.best()
+
+    def best_ask(self):
+        return self.asks.best()
+
+    def top_n(self, n=5):
+        return self.bids.top_n(n), self.asks.top_n(n)
+
+    def to_dict(self, n=5):
+        bids, asks = self.top_n(n)
+        return {'time': self.time, 'bids': bids, 'asks': asks}
+
+
+def benchmark(depth, n_updates=200000, levels_per_update=3, seed=0):
+    '''
+    Feeds one snapshot and n_updates random deltas (a mix of inserts, size changes and
+    deletes around the touch) into a book of the given depth, returns updates per second.
+    '''
+    rng = random.Random(seed)
+    tick = 0.5
+    mid = 60000.0
+    bids = [(mid - tick * (i + 1), rng.uniform(0.1, 5)) for i in range(depth)]
+    asks = [(mid + tick * (i + 1), rng.uniform(0.1, 5)) for i in range(depth)]
+    deltas = []
+    for _ in range(n_updates):
+        side_bids = []
+        side_asks = []
+        for _ in range(levels_per_update):
+            offset = tick * rng.randint(1, depth)
+            size = 0.0 if rng.random() < 0.3 else rng.uniform(0.1, 5)
+            if rng.random() < 0.5:
+                side_bids.append((mid - offset, size))
+            else:
+                side_asks.append((mid + offset, size))
+        deltas.append((side_bids, side_asks))
+
+    book = OrderBook('BENCH', 'bybit', max_depth=depth)
+    book.apply_snapshot(bids, asks, 0)
+    start = time.perf_counter()
+    for ts, (delta_bids, delta_asks) in enumerate(deltas):
+        book.apply_delta(delta_bids, delta_asks, ts)
+        book.best_bid()
+        book.best_ask()
+    elapsed = time.perf_counter() - start
+    return n_updates / elapsed
+
+
+if __name__ == "__main__":
+    for depth in (50, 200, 500):
+        rate = benchmark(depth)
+        print(f"depth {depth:>3}: {rate:,.0f} updates/sec")
@@ -0,0 +1,125 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from decoder import dumps
+
+
+class RedisSnapshotPublisher:
+    '''
+    Buffers combined spread snapshots per symbol and writes them to Redis capped lists
+    (RPUSH + LTRIM to the last max_len) in pipelined batches, flushed when batch_size
+    snapshots are pending or every flush_interval seconds. publish() never touches the
+    network. Each symbol's buffer holds at most max_len snapshots, older ones would be
+    trimmed by Redis anyway, so a slow or unreachable Redis costs bounded memory. Beyond
+    max_pending buffered snapshots in total, publish() refuses new ones (backpressure).
+    With a latency_recorder, every snapshot's publish() -> pipeline executed time is
+    recorded as its 'redis' stage.
+    '''
+    def __init__(self, redis_client, key_prefix='combined_data_', max_len=500, batch_size=200,
+                 flush_interval=0.05, max_pending=50000, retry_interval=1.0, serializer=dumps, latency_recorder=None):
+        self.redis = redis_client  # redis.asyncio.Redis
+        self.key_prefix = key_prefix
+        self.max_len = max_len
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.retry_interval = retry_interval
+        self.serializer = serializer
+        self.latency_recorder = latency_recorder
+        self.buffers = {}  # symbol -> deque of (serialized snapshot, monotonic ns published)
+        self.pending = 0
+        self._flush_now = asyncio.Event()
+        self.published = 0
+        self.superseded = 0  # older than the last max_len of a symbol before they were sent
+        self.rejected = 0
+        self.flushes = 0
+        self.errors = 0
+        self.failing = False
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+    def publish(self, symbol, snapshot):
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            return False
+        buffer = self.buffers.get(symbol)
+        if buffer is None:
+            buffer = self.buffers[symbol] = deque(maxlen=self.max_len)
+        if len(buffer) == self.max_len:
+            self.superseded += 1
+        else:
+            self.pending += 1
+        buffer.append((self.serializer(snapshot), time.monotonic_ns()))
+        if self.pending >= self.batch_size:
+            self._flush_now.set()
+        return True
+
+    async def flush(self):
+        if not self.pending:
+            return 0
+        buffers, self.buffers = self.buffers, {}
+        count, self.pending = self.pending, 0
+        start = time.perf_counter()
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                for symbol, items in buffers.items():
+                    key = f'{self.key_prefix}{symbol}'
+                    pipe.rpush(key, *[payload for payload, _ in items])
+                    pipe.ltrim(key, -self.max_len, -1)
+                await pipe.execute()
+        except Exception as e:
+            self.errors += 1
+            self.failing = True
+            logging.error(f"Redis flush of {count} snapshots failed: {e}")
+            self._requeue(buffers)
+            return 0
+        elapsed = (time.perf_counter() - start) * 1000
+        if self.latency_recorder is not None:
+            written = time.monotonic_ns()
+            for symbol, items in buffers.items():
+                for _, published in items:
+                    self.latency_recorder.record('redis', symbol, 'combined', written - published)
+        self.failing = False
+        self.flushes += 1
+        self.published += count
+        self.last_flush_ms = elapsed
+        self.max_flush_ms = max(self.max_flush_ms, elapsed)
+        self.total_flush_ms += elapsed
+        return count
+
+    def _requeue(self, buffers):
+        # put the failed batch back in front of anything published during the flush
+        for symbol, items in buffers.items():
+            newer = self.buffers.get(symbol, ())
+            merged = deque(items, maxlen=self.max_len)
+            merged.extend(newer)
+            self.buffers[symbol] = merged
+        self.pending = sum(len(items) for items in self.buffers.values())
+
+    async def run(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+            if self.failing:
+                # redis is down, keep buffering (bounded) instead of spinning on it
+                await asyncio.sleep(self.retry_interval)
+
+    def stats(self):
+        return {
+            'queue_depth': self.pending,
+            'symbols': len(self.buffers),
+            'published': self.published,
+            'superseded': self.superseded,
+            'rejected': self.rejected,
+            'flushes': self.flushes,
+            'errors': self.errors,
+            'last_flush_ms': round(self.last_flush_ms, 3),
+            'avg_flush_ms': round(self.total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+            'max_flush_ms': round(self.max_flush_ms, 3),
+        }
@@ -0,0 +1,71 @@
+import logging
+
+
+class CoalescingScheduler:
+    '''
+    Dirty-flag compute scheduler. Every book update marks its symbol dirty; the symbol is
+    then computed at most once per interval, always on the latest state. A mark that lands
+    inside the interval is never dropped: it schedules a trailing run at the end of the
+    window, so the last state before a quiet period is always computed.
+    '''
+    def __init__(self, compute, default_interval=0.025, intervals=None):
+        self.compute = compute  # compute(symbol, context)
+        self.default_interval = default_interval
+        self.intervals = dict(intervals or {})  # symbol -> seconds, overrides default_interval
+        self._loop = None
+        self._dirty = {}  # symbol -> context of the latest mark
+        self._scheduled = {}  # symbol -> asyncio handle of the pending run
+        self._last_run = {}
+        self.marks = 0
+        self.runs = 0
+
+    def bind(self, loop):
+        self._loop = loop
+
+    def set_interval(self, symbol, seconds):
+        self.intervals[symbol] = seconds
+
+    def interval(self, symbol):
+        return self.intervals.get(symbol, self.default_interval)
+
+    def mark_dirty(self, symbol, context=None):
+        self.marks += 1
+        # a hyperliquid update carries no bybit depth, keep the one a pending bybit update left
+        if context is not None or symbol not in self._dirty:
+            self._dirty[symbol] = context
+        if symbol in self._scheduled:
+            return
+        now = self._loop.time()
+        due = self._last_run.get(symbol, float('-inf')) + self.interval(symbol)
+        if due <= now:
+            # leading edge: run after the current batch of updates has been applied
+            self._scheduled[symbol] = self._loop.call_soon(self._run, symbol)
+        else:
+            self._scheduled[symbol] = self._loop.call_at(due, self._run, symbol)
+
+    def _run(self, symbol):
+        self._scheduled.pop(symbol, None)
+        if symbol not in self._dirty:
+            return
+        context = self._dirty.pop(symbol)
+        self._last_run[symbol] = self._loop.time()
+        self.runs += 1
+        try:
+            self.compute(symbol, context)
+        except Exception as e:
+            logging.error(f"Error computing {symbol}: {e}")
+
+    def cancel(self, symbol):
+        handle = self._scheduled.pop(symbol, None)
+        if handle is not None:
+            handle.cancel()
+        self._dirty.pop(symbol, None)
+        self._last_run.pop(symbol, None)
+
+    def stats(self):
+        return {
+            'marks': self.marks,
+            'runs': self.runs,
+            'coalesced': self.marks - self.runs - len(self._dirty),
+            'pending': len(self._scheduled),
+        }
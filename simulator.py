@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import logging
+import random
+import time
+import websockets
+from decoder import dumps
+
+
+def _text(obj):
+    # exchanges send text frames, orjson produces bytes
+    payload = dumps(obj)
+    return payload.decode() if isinstance(payload, bytes) else payload
+
+
+class SyntheticBook:
+    '''
+    Random-walk order book on an integer tick grid: bids at mid-1, mid-2, ..., asks at
+    mid+1, mid+2, ... Every step resizes a few levels near the top and sometimes moves the
+    mid by one tick, and returns only the levels that changed (a size of 0 deletes).
+    '''
+    def __init__(self, mid_tick, tick_size=0.01, depth=50, rng=None):
+        self.mid = mid_tick
+        self.tick_size = tick_size
+        self.depth = depth
+        self.rng = rng or random.Random()
+        self.sizes = {}  # tick -> size
+
+    def _price(self, tick):
+        return f'{tick * self.tick_size:.2f}'
+
+    def _size(self, tick):
+        size = self.sizes.get(tick)
+        if size is None:
+            size = self.sizes[tick] = round(self.rng.uniform(0.1, 50), 3)
+        return size
+
+    def levels(self, depth=None):
+        depth = depth or self.depth
+        bids = [(self._price(self.mid - i), str(self._size(self.mid - i))) for i in range(1, depth + 1)]
+        asks = [(self._price(self.mid + i), str(self._size(self.mid + i))) for i in range(1, depth + 1)]
+        return bids, asks
+
+    def step(self, changes=4):
+        bids, asks = {}, {}
+        move = self.rng.random()
+        if move < 0.05:
+            # mid up one tick: the best ask is taken out, a new best bid appears
+            self.mid += 1
+            asks[self.mid] = '0'
+            bids[self.mid - 1] = None
+            asks[self.mid + self.depth] = None
+            bids[self.mid - self.depth - 1] = '0'
+        elif move < 0.10:
+            self.mid -= 1
+            bids[self.mid] = '0'
+            asks[self.mid + 1] = None
+            bids[self.mid - self.depth] = None
+            asks[self.mid + self.depth + 1] = '0'
+        for _ in range(changes):
+            offset = min(int(self.rng.expovariate(0.3)) + 1, self.depth)
+            side, tick = (bids, self.mid - offset) if self.rng.random() < 0.5 else (asks, self.mid + offset)
+            self.sizes[tick] = round(self.rng.uniform(0.1, 50), 3)
+            side[tick] = None
+        for side in (bids, asks):
+            for tick, size in side.items():
+                if size == '0':
+                    self.sizes.pop(tick, None)
+        return ([(self._price(tick), size or str(self._size(tick))) for tick, size in bids.items()],
+                [(self._price(tick), size or str(self._size(tick))) for tick, size in asks.items()])
+
+
+class _Simulator:
+    '''
+    Shared streaming loop: every connection gets `rate` messages per second per subscribed
+    stream, generated in small time slices so the rate holds at any subscription count.
+    rate can be changed live by any client sending {"op": "sim_rate", "rate": n};
+    {"op": "sim_stats"} answers with the number of frames sent so far.
+    '''
+    def __init__(self, rate=10, tick=0.005, seed=None):
+        self.rate = rate
+        self.tick = tick
+        self.rng = random.Random(seed)
+        self.sent = 0
+        self.connections = 0
+
+    def _book(self, name):
+        # deterministic mid per name so both venues quote around the same price
+        mid = 1000000 + sum(map(ord, name)) * 1000
+        return SyntheticBook(mid, rng=random.Random(f'{name}{self.rng.random()}'))
+
+    async def _control(self, websocket, request):
+        if request.get('op') == 'sim_rate':
+            self.rate = float(request['rate'])
+            logging.info(f"{type(self).__name__}: rate set to {self.rate} msgs/sec per stream")
+            await websocket.send(json.dumps({'op': 'sim_rate', 'rate': self.rate}))
+            return True
+        if request.get('op') == 'sim_stats':
+            await websocket.send(json.dumps({'op': 'sim_stats', 'sent': self.sent, 'connections': self.connections, 'rate': self.rate}))
+            return True
+        return False
+
+    async def _stream(self, websocket, streams):
+        budget = 0.0
+        last = time.monotonic()
+        position = 0
+        while True:
+            await asyncio.sleep(self.tick)
+            now = time.monotonic()
+            if not streams:
+                last = now
+                continue
+            names = list(streams)
+            # at most one tick of catch-up, a slow reader lowers the achieved rate instead of bursting
+            budget = min(budget + (now - last) * self.rate * len(names), self.rate * len(names) * self.tick * 2 + 1)
+            last = now
+            count = int(budget)
+            budget -= count
+            for _ in range(count):
+                name = names[position % len(names)]
+                position += 1
+                await websocket.send(self.frame(name, streams[name]))
+                self.sent += 1
+
+    async def handler(self, websocket):
+        streams = {}
+        self.connections += 1
+        producer = asyncio.create_task(self._stream(websocket, streams))
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                if not await self._control(websocket, request):
+                    await self.on_request(websocket, request, streams)
+        except websockets.exceptions.ConnectionClosed:
+            pass
+        finally:
+            producer.cancel()
+            self.connections -= 1
+
+    async def serve(self, host, port):
+        async with websockets.serve(self.handler, host, port, max_size=None):
+            logging.info(f"{type(self).__name__} listening on ws://{host}:{port}")
+            await asyncio.Future()
+
+
+class BybitSimulator(_Simulator):
+    '''
+    Speaks the Bybit v5 public orderbook protocol: {"op": "subscribe", "args": [...]}
+    is acknowledged, each orderbook.{depth}.{symbol} topic starts with a snapshot and then
+    streams deltas ("ping" ops get the text pong pybit expects). Depth 1 streams snapshots only.
+    '''
+    async def on_request(self, websocket, request, streams):
+        op = request.get('op')
+        if op == 'ping':
+            await websocket.send(json.dumps({'success': True, 'ret_msg': 'pong', 'conn_id': str(id(websocket)), 'req_id': request.get('req_id', ''), 'op': 'ping'}))
+        elif op in ('subscribe', 'unsubscribe'):
+            added = {}
+            for topic in request.get('args', []):
+                if op == 'unsubscribe':
+                    streams.pop(topic, None)
+                    continue
+                _, depth, instrument = topic.split('.')
+                book = self._book(instrument[:-4])
+                book.depth = int(depth)
+                added[topic] = {'book': book, 'update_id': 0, 'depth': int(depth), 'instrument': instrument}
+            await websocket.send(json.dumps({'success': True, 'ret_msg': '', 'conn_id': str(id(websocket)), 'req_id': request.get('req_id', ''), 'op': op}))
+            for topic, stream in added.items():
+                await websocket.send(self.frame(topic, stream, snapshot=True))
+            # deltas only start once the snapshot is out
+            streams.update(added)
+
+    def frame(self, topic, stream, snapshot=False):
+        book = stream['book']
+        stream['update_id'] += 1
+        if snapshot or stream['depth'] == 1:
+            if not snapshot:
+                book.step()
+            bids, asks = book.levels(stream['depth'])
+            kind = 'snapshot'
+        else:
+            bids, asks = book.step()
+            kind = 'delta'
+        now_ms = int(time.time() * 1000)
+        return _text({'topic': topic, 'type': kind, 'ts': now_ms,
+                      'data': {'s': stream['instrument'], 'b': bids, 'a': asks, 'u': stream['update_id'], 'seq': stream['update_id']},
+                      'cts': now_ms})
+
+
+class HyperliquidSimulator(_Simulator):
+    '''
+    Speaks the Hyperliquid websocket protocol for l2Book: {"method": "subscribe",
+    "subscription": {"type": "l2Book", "coin": ...}} is acknowledged with a
+    subscriptionResponse, then every message is a full 20-level snapshot of that coin.
+    {"method": "ping"} gets {"channel": "pong"}.
+    '''
+    levels = 20
+
+    async def on_request(self, websocket, request, streams):
+        method = request.get('method')
+        if method == 'ping':
+            await websocket.send(json.dumps({'channel': 'pong'}))
+        elif method in ('subscribe', 'unsubscribe'):
+            subscription = request.get('subscription', {})
+            coin = subscription.get('coin')
+            if method == 'unsubscribe':
+                streams.pop(coin, None)
+            elif subscription.get('type') == 'l2Book':
+                streams[coin] = {'book': self._book(coin)}
+            await websocket.send(json.dumps({'channel': 'subscriptionResponse', 'data': request}))
+
+    def frame(self, coin, stream):
+        book = stream['book']
+        book.step()
+        bids, asks = book.levels(self.levels)
+        return _text({'channel': 'l2Book', 'data': {
+            'coin': coin, 'time': int(time.time() * 1000),
+            'levels': [[{'px': px, 'sz': sz, 'n': 1} for px, sz in bids],
+                       [{'px': px, 'sz': sz, 'n': 1} for px, sz in asks]]}})
+
+
+async def main(host, bybit_port, hyperliquid_port, rate, seed=None):
+    await asyncio.gather(
+        BybitSimulator(rate, seed=seed).serve(host, bybit_port),
+        HyperliquidSimulator(rate, seed=seed).serve(host, hyperliquid_port),
+    )
+
+
+if __name__ == "__main__":
+    # python simulator.py --rate 50
+    # then bybit_ws_url = "ws://127.0.0.1:8801/v5/public/linear", hyperliquid_ws_url = "ws://127.0.0.1:8802"
+    parser = argparse.ArgumentParser(description="Local Bybit v5 orderbook and Hyperliquid l2Book websocket simulators")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--bybit-port', type=int, default=8801)
+    parser.add_argument('--hyperliquid-port', type=int, default=8802)
+    parser.add_argument('--rate', type=float, default=10, help="messages per second per subscribed stream")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s:%(message)s')
+    try:
+        asyncio.run(main(args.host, args.bybit_port, args.hyperliquid_port, args.rate, args.seed))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,148 @@
+'''
+Versioned binary layout for combined_data_impact records (little endian):
+
+    header   version:u8 flags:u8 ladder_count:u16 depth_levels:u16 pad:u16
+             timestamp_ms:i64 time_hyperliquid:i64 time_bybit:i64 timelag_ms:i64
+             best bid/ask price hyperliquid, best bid/ask price bybit,
+             best bid/ask size hyperliquid, best bid/ask size bybit,
+             entry_spread, exit_spread                                     (10 x f64)
+    ladder   ladder_count x (notional, impact bid/ask hyperliquid,
+             impact bid/ask bybit, entry_spread, exit_spread)               (7 x f64 each)
+    depth    only when FLAG_DEPTH is set: hyperliquid bids, hyperliquid asks,
+             bybit bids, bybit asks, each depth_levels x (price, size) f64,
+             short books padded with NaN
+
+Missing values are NaN (floats) or MISSING_INT (-2**63, integers). A record is 120 bytes plus 56 per
+ladder rung, against several hundred bytes of JSON with both order books embedded.
+'''
+
+import math
+import struct
+from datetime import datetime, timezone
+
+RECORD_VERSION = 1
+FLAG_IMPACT_REACHED = 0x01
+FLAG_DEPTH = 0x02
+
+HEADER = struct.Struct('<BBHHHqqqq10d')
+LADDER_ENTRY = struct.Struct('<7d')
+LADDER_FIELDS = ('impact_bid_price_hyperliquid', 'impact_ask_price_hyperliquid',
+                 'impact_bid_price_bybit', 'impact_ask_price_bybit', 'entry_spread', 'exit_spread')
+NAN = float('nan')
+MISSING_INT = -2 ** 63
+
+
+def _f(value):
+    return NAN if value is None else float(value)
+
+
+def _i(value):
+    return MISSING_INT if value is None else int(value)
+
+
+def _opt_i(value):
+    return None if value == MISSING_INT else value
+
+
+def _opt(value):
+    return None if math.isnan(value) else value
+
+
+def _level(levels, i, j):
+    return levels[i][j] if len(levels) > i else None
+
+
+def _depth_values(levels, n):
+    values = []
+    for i in range(n):
+        if i < len(levels):
+            values.append(float(levels[i][0]))
+            values.append(float(levels[i][1]))
+        else:
+            values.append(NAN)
+            values.append(NAN)
+    return values
+
+
+def encode_record(record, depth_levels=0):
+    '''
+    Packs a combined_data_impact dict. depth_levels > 0 appends that many levels of each
+    side of both books; 0 keeps only the fixed header and the impact ladder.
+    '''
+    hyperliquid = record.get('hyperliquid_orderbook') or {'bids': [], 'asks': [], 'time': None}
+    bybit = record.get('bybit_orderbook') or {'bids': [], 'asks': [], 'time': None}
+    ladder = record.get('impact_ladder') or {}
+    flags = 0
+    if record.get('impact_price_reached'):
+        flags |= FLAG_IMPACT_REACHED
+    if depth_levels:
+        flags |= FLAG_DEPTH
+    parts = [HEADER.pack(
+        RECORD_VERSION, flags, len(ladder), depth_levels, 0,
+        _i(record.get('timestamp_ms')), _i(hyperliquid.get('time')), _i(bybit.get('time')), _i(record.get('timelag')),
+        _f(record.get('best_bid_price_hyperliquid')), _f(record.get('best_ask_price_hyperliquid')),
+        _f(record.get('best_bid_price_bybit')), _f(record.get('best_ask_price_bybit')),
+        _f(_level(hyperliquid['bids'], 0, 1)), _f(_level(hyperliquid['asks'], 0, 1)),
+        _f(_level(bybit['bids'], 0, 1)), _f(_level(bybit['asks'], 0, 1)),
+        _f(record.get('entry_spread')), _f(record.get('exit_spread')),
+    )]
+    for notional, rung in ladder.items():
+        parts.append(LADDER_ENTRY.pack(float(notional), *(_f(rung.get(field)) for field in LADDER_FIELDS)))
+    if depth_levels:
+        values = []
+        for levels in (hyperliquid['bids'], hyperliquid['asks'], bybit['bids'], bybit['asks']):
+            values.extend(_depth_values(levels, depth_levels))
+        parts.append(struct.pack(f'<{len(values)}d', *values))
+    return b''.join(parts)
+
+
+def decode_record(data):
+    '''Unpacks a record produced by encode_record back into a combined_data_impact-style dict.'''
+    version = data[0]
+    if version != RECORD_VERSION:
+        raise ValueError(f"Unsupported spread record version {version}")
+    (version, flags, ladder_count, depth_levels, _, timestamp_ms, time_hyperliquid, time_bybit, timelag,
+     bid_hl, ask_hl, bid_by, ask_by, bid_size_hl, ask_size_hl, bid_size_by, ask_size_by,
+     entry_spread, exit_spread) = HEADER.unpack_from(data, 0)
+    offset = HEADER.size
+    ladder = {}
+    for _ in range(ladder_count):
+        notional, *values = LADDER_ENTRY.unpack_from(data, offset)
+        offset += LADDER_ENTRY.size
+        key = int(notional) if notional.is_integer() else notional
+        ladder[key] = {field: _opt(value) for field, value in zip(LADDER_FIELDS, values)}
+    record = {
+        'version': version,
+        'timestamp_ms': _opt_i(timestamp_ms),
+        'timestamp': datetime.fromtimestamp(timestamp_ms / 1000, timezone.utc).isoformat(timespec='milliseconds') if timestamp_ms != MISSING_INT else None,
+        'best_bid_price_hyperliquid': _opt(bid_hl),
+        'best_ask_price_hyperliquid': _opt(ask_hl),
+        'best_bid_price_bybit': _opt(bid_by),
+        'best_ask_price_bybit': _opt(ask_by),
+        'best_bid_size_hyperliquid': _opt(bid_size_hl),
+        'best_ask_size_hyperliquid': _opt(ask_size_hl),
+        'best_bid_size_bybit': _opt(bid_size_by),
+        'best_ask_size_bybit': _opt(ask_size_by),
+        'entry_spread': _opt(entry_spread),
+        'exit_spread': _opt(exit_spread),
+        'time_hyperliquid': _opt_i(time_hyperliquid),
+        'time_bybit': _opt_i(time_bybit),
+        'timelag': _opt_i(timelag),
+        'impact_ladder': ladder,
+        'impact_price_reached': bool(flags & FLAG_IMPACT_REACHED),
+    }
+    if flags & FLAG_DEPTH:
+        count = depth_levels * 2
+        sides = []
+        for _ in range(4):
+            values = struct.unpack_from(f'<{count}d', data, offset)
+            offset += count * 8
+            sides.append([(values[i], values[i + 1]) for i in range(0, count, 2) if not math.isnan(values[i])])
+        record['hyperliquid_orderbook'] = {'time': record['time_hyperliquid'], 'bids': sides[0], 'asks': sides[1]}
+        record['bybit_orderbook'] = {'time': record['time_bybit'], 'bids': sides[2], 'asks': sides[3]}
+    return record
+
+
+def decode_records(items):
+    # e.g. decode_records(redis_client.lrange('combined_data_bin_BTC', -100, -1))
+    return [decode_record(item) for item in items]
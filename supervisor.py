@@ -0,0 +1,264 @@
+import argparse
+import asyncio
+import json
+import logging
+import multiprocessing
+import os
+import time
+from latency import LatencyHistogram, stages, publish_latency, serve_latency
+from telemetry import setup_logging
+
+
+def assign_shards(symbols, workers, weights=None):
+    '''
+    Splits symbols into `workers` shards with balanced load: heaviest symbols first, each to
+    the currently lightest shard. weights maps symbol -> relative load (e.g. messages/sec),
+    missing symbols count as 1.
+    '''
+    weights = weights or {}
+    shards = [[] for _ in range(workers)]
+    loads = [0.0] * workers
+    for symbol in sorted(symbols, key=lambda symbol: -weights.get(symbol, 1)):
+        shard = loads.index(min(loads))
+        shards[shard].append(symbol)
+        loads[shard] += weights.get(symbol, 1)
+    return shards
+
+
+def _worker_metrics(collector, shard):
+    return {
+        'shard': shard,
+        'pid': os.getpid(),
+        'time': time.time(),
+        'symbols': len(collector.latest_data),
+        'handoff': collector.feed_handoff.stats(),
+        'scheduler': collector.compute_scheduler.stats(),
+        'publisher': collector.redis_publisher.stats(),
+        'bybit': collector.bybit_manager.stats() if collector.bybit_manager is not None else None,
+        'hyperliquid': collector.hyperliquid_session.stats() if collector.hyperliquid_session is not None else None,
+        'latency': {stage: collector.latency_recorder.combined(stage).export() for stage in stages},
+    }
+
+
+def run_worker(shard, shard_symbols, conn, heartbeat_interval, settings=None):
+    '''
+    Entry point of a worker process: the full collector (both venues) for shard_symbols only.
+    settings overrides byBitHyperLiquid globals, e.g. {'hyperliquid_ws_url': ...}, through
+    collector.configure so the objects built from them at import are rebuilt too.
+    '''
+    import byBitHyperLiquid as collector
+    setup_logging(f"websocketByHyper.shard{shard}.log")
+    settings = dict(settings or {}, latency_port=None)  # the supervisor serves the aggregated histograms
+    top_of_book_path = settings.get('top_of_book_path', collector.top_of_book_path)
+    if top_of_book_path:
+        # every writer zeroes its table on start, shards must not share one
+        settings['top_of_book_path'] = f"{top_of_book_path}.shard{shard}"
+    collector.configure(settings)
+    if collector.dynamic_universe:
+        # every worker would track the whole listing, the shard is fixed by the supervisor
+        logging.warning(f"Shard {shard}: dynamic_universe is not supported in workers, tracking the shard's symbols only")
+        collector.dynamic_universe = False
+    # in place: everything holding the import-time list sees the shard, not the full symbol list
+    collector.symbols[:] = shard_symbols
+    for symbol in list(collector.latest_data):
+        if symbol not in shard_symbols:
+            collector.remove_symbol_state(symbol)
+    for symbol in shard_symbols:
+        if symbol not in collector.latest_data:
+            collector.add_symbol_state(symbol)
+
+    async def heartbeat():
+        while True:
+            conn.send(_worker_metrics(collector, shard))
+            await asyncio.sleep(heartbeat_interval)
+
+    async def worker_main():
+        logging.info(f"Shard {shard} (pid {os.getpid()}): {len(shard_symbols)} symbols {shard_symbols}")
+        await asyncio.gather(heartbeat(), collector.main())
+
+    try:
+        asyncio.run(worker_main())
+    except KeyboardInterrupt:
+        pass
+
+
+class Worker:
+    def __init__(self, shard, symbols):
+        self.shard = shard
+        self.symbols = symbols
+        self.process = None
+        self.conn = None
+        self.started = 0.0
+        self.last_heartbeat = 0.0
+        self.metrics = None
+        self.restarts = 0
+        self.failures = 0  # consecutive short-lived runs, drives the restart backoff
+        self.next_start = 0.0
+
+
+class ShardSupervisor:
+    '''
+    Runs the collector as one process per shard of the symbol list. Each worker owns both
+    venues' sockets and books for its symbols and reports its stats and latency histograms
+    over a pipe every heartbeat_interval. A worker that exits or stops reporting for
+    heartbeat_timeout seconds is killed and restarted with exponential backoff.
+    summary() aggregates every worker's counters and histograms.
+    '''
+    def __init__(self, symbols, workers, weights=None, heartbeat_interval=2.0, heartbeat_timeout=30.0,
+                 startup_grace=60.0, min_backoff=1.0, max_backoff=60.0, stable_after=120.0, settings=None):
+        self.settings = settings
+        self.heartbeat_interval = heartbeat_interval
+        self.heartbeat_timeout = heartbeat_timeout
+        self.startup_grace = startup_grace  # import, connect and subscribe before the first heartbeat counts
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.stable_after = stable_after
+        # spawn: workers must not inherit pybit threads or a running event loop
+        self.context = multiprocessing.get_context('spawn')
+        self.workers = [Worker(shard, shard_symbols)
+                        for shard, shard_symbols in enumerate(assign_shards(symbols, workers, weights)) if shard_symbols]
+
+    def _start(self, worker):
+        parent, child = self.context.Pipe(duplex=False)
+        worker.process = self.context.Process(target=run_worker, name=f'feed-shard-{worker.shard}',
+                                              args=(worker.shard, worker.symbols, child, self.heartbeat_interval, self.settings), daemon=True)
+        worker.process.start()
+        child.close()
+        worker.conn = parent
+        worker.started = worker.last_heartbeat = time.monotonic()
+        logging.info(f"Started shard {worker.shard} (pid {worker.process.pid}) with {len(worker.symbols)} symbols")
+
+    async def _stop(self, worker, grace=5.0):
+        # polled instead of join() so heartbeats and the metrics endpoint keep running
+        if worker.process is not None and worker.process.is_alive():
+            worker.process.terminate()
+            deadline = time.monotonic() + grace
+            while worker.process.is_alive() and time.monotonic() < deadline:
+                await asyncio.sleep(0.05)
+            if worker.process.is_alive():
+                worker.process.kill()
+                while worker.process.is_alive():
+                    await asyncio.sleep(0.05)
+            worker.process.join()
+        if worker.conn is not None:
+            worker.conn.close()
+        worker.process = worker.conn = None
+
+    def _collect(self, worker):
+        try:
+            while worker.conn.poll():
+                worker.metrics = worker.conn.recv()
+                worker.last_heartbeat = time.monotonic()
+        except (EOFError, OSError):
+            pass
+
+    async def _check(self, worker):
+        now = time.monotonic()
+        if worker.process is None:
+            if now >= worker.next_start:
+                self._start(worker)
+            return
+        self._collect(worker)
+        if worker.process.is_alive():
+            timeout = self.heartbeat_timeout if worker.metrics is not None else self.startup_grace
+            if now - worker.last_heartbeat <= timeout:
+                if now - worker.started > self.stable_after:
+                    worker.failures = 0
+                return
+            logging.error(f"Shard {worker.shard} (pid {worker.process.pid}) missed heartbeats for {now - worker.last_heartbeat:.0f}s, restarting")
+        else:
+            logging.error(f"Shard {worker.shard} (pid {worker.process.pid}) exited with code {worker.process.exitcode}, restarting")
+        await self._stop(worker)
+        delay = min(self.max_backoff, self.min_backoff * 2 ** worker.failures)
+        worker.failures += 1
+        worker.restarts += 1
+        worker.metrics = None
+        worker.next_start = now + delay
+        logging.info(f"Restarting shard {worker.shard} in {delay:.1f}s")
+
+    async def run(self, check_interval=1.0):
+        try:
+            while True:
+                for worker in self.workers:
+                    await self._check(worker)
+                await asyncio.sleep(check_interval)
+        finally:
+            for worker in self.workers:
+                # the loop may be shutting down, no awaiting here
+                if worker.process is not None and worker.process.is_alive():
+                    worker.process.terminate()
+            for worker in self.workers:
+                if worker.process is not None:
+                    worker.process.join(5)
+                    if worker.process.is_alive():
+                        worker.process.kill()
+                if worker.conn is not None:
+                    worker.conn.close()
+
+    def summary(self):
+        now = time.monotonic()
+        totals = {}
+        histograms = {stage: LatencyHistogram() for stage in stages}
+        workers = {}
+        for worker in self.workers:
+            metrics = worker.metrics
+            workers[f'shard{worker.shard}'] = {
+                'pid': worker.process.pid if worker.process is not None else None,
+                'alive': worker.process is not None and worker.process.is_alive(),
+                'symbols': len(worker.symbols),
+                'restarts': worker.restarts,
+                'heartbeat_age_s': round(now - worker.last_heartbeat, 1) if metrics is not None else None,
+            }
+            if metrics is None:
+                continue
+            for group in ('handoff', 'scheduler', 'publisher'):
+                for name, value in metrics[group].items():
+                    if isinstance(value, (int, float)) and not isinstance(value, bool) and not name.endswith('_ms'):
+                        key = f'{group}_{name}'
+                        totals[key] = totals.get(key, 0) + value
+            for stage, exported in metrics['latency'].items():
+                histograms[stage].merge_export(exported)
+        return {
+            'workers': workers,
+            'totals': totals,
+            'latency': {stage: histogram.summary() for stage, histogram in histograms.items() if histogram.total},
+        }
+
+
+async def supervise(symbols, workers, weights=None, metrics_port=8790, redis_client=None, stats_interval=60, settings=None):
+    supervisor = ShardSupervisor(symbols, workers, weights, settings=settings)
+    tasks = [supervisor.run()]
+    if metrics_port is not None:
+        tasks.append(serve_latency(supervisor, '127.0.0.1', metrics_port))
+    if redis_client is not None:
+        tasks.append(publish_latency(supervisor, redis_client, 'feed_supervisor'))
+
+    async def log_stats():
+        while True:
+            await asyncio.sleep(stats_interval)
+            summary = supervisor.summary()
+            logging.info(f"Supervisor workers: {summary['workers']}")
+            logging.info(f"Supervisor totals: {summary['totals']}")
+            logging.info(f"Supervisor latency: {summary['latency']}")
+    tasks.append(log_stats())
+    await asyncio.gather(*tasks)
+
+
+if __name__ == "__main__":
+    # python supervisor.py --workers 4 --symbols BTC,ETH,SOL,...
+    parser = argparse.ArgumentParser(description="Run the collector as one process per shard of symbols")
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--symbols', default=None, help="comma separated coins, default byBitHyperLiquid.symbols")
+    parser.add_argument('--metrics-port', type=int, default=8790)
+    parser.add_argument('--settings', default=None, help="JSON object of byBitHyperLiquid settings for every worker, e.g. '{\"compute_mode\": \"batch\"}'")
+    args = parser.parse_args()
+    if args.symbols:
+        shard_symbols = args.symbols.split(',')
+    else:
+        from byBitHyperLiquid import symbols as shard_symbols
+    setup_logging("supervisor.log")
+    try:
+        asyncio.run(supervise(shard_symbols, args.workers, metrics_port=args.metrics_port,
+                              settings=json.loads(args.settings) if args.settings else None))
+    except KeyboardInterrupt:
+        pass
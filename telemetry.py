@@ -0,0 +1,164 @@
+import atexit
+import logging
+import queue
+import struct
+import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+
+_listener = None  # the process's QueueListener, reused by later setup_logging calls
+
+
+def setup_logging(log_file, level=logging.INFO, fmt='%(asctime)s %(levelname)s:%(message)s', max_queue=100000):
+    '''
+    Routes the root logger through a bounded queue: the hot path only enqueues the record
+    and a listener thread does the file and console I/O. Records are dropped (and counted
+    by the handler) when the queue is full rather than blocking the feed. Calling it again
+    (e.g. a shard worker after importing the collector) keeps the queue and listener and
+    only swaps the handlers, closing the previous log file.
+    '''
+    global _listener
+    formatter = logging.Formatter(fmt)
+    file_handler = logging.FileHandler(log_file)
+    stream_handler = logging.StreamHandler()
+    for handler in (file_handler, stream_handler):
+        handler.setFormatter(formatter)
+    root = logging.getLogger()
+    root.setLevel(level)
+    if _listener is not None:
+        # drain what is queued into the old file, then restart the thread on the new handlers
+        _listener.stop()
+        for handler in _listener.handlers:
+            handler.close()
+        _listener.handlers = (file_handler, stream_handler)
+        _listener.start()
+        return _listener
+    log_queue = queue.Queue(max_queue)
+    queue_handler = _DroppingQueueHandler(log_queue)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    _listener = QueueListener(log_queue, file_handler, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return _listener
+
+
+class _DroppingQueueHandler(QueueHandler):
+    def __init__(self, log_queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class TickSampler:
+    '''Lets at most one tick per symbol through every interval seconds.'''
+    def __init__(self, interval=1.0):
+        self.interval = interval
+        self.last = {}
+        self.suppressed = 0
+
+    def should_log(self, symbol, now=None):
+        now = time.monotonic() if now is None else now
+        if now - self.last.get(symbol, float('-inf')) >= self.interval:
+            self.last[symbol] = now
+            return True
+        self.suppressed += 1
+        return False
+
+
+class BinaryTickLog:
+    '''
+    Fixed-size binary tick records written by a background thread:
+    symbol (8 bytes), epoch ms, best bid/ask on hyperliquid and bybit, entry/exit spread, timelag.
+    Missing values are stored as NaN.
+    '''
+    record = struct.Struct('<8sq7d')
+
+    def __init__(self, path, max_queue=100000, flush_every=1000):
+        self.path = path
+        self.flush_every = flush_every
+        self.queue = queue.Queue(max_queue)
+        self.dropped = 0
+        self.written = 0
+        self._thread = threading.Thread(target=self._run, name='binary-tick-log', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def write(self, symbol, ts_ms, record):
+        nan = float('nan')
+
+        def value(key):
+            v = record.get(key)
+            return nan if v is None else float(v)
+        packed = self.record.pack(
+            symbol.encode()[:8], int(ts_ms),
+            value('best_bid_price_hyperliquid'), value('best_ask_price_hyperliquid'),
+            value('best_bid_price_bybit'), value('best_ask_price_bybit'),
+            value('entry_spread'), value('exit_spread'), value('timelag'))
+        try:
+            self.queue.put_nowait(packed)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, 'ab') as f:
+            pending = 0
+            while True:
+                packed = self.queue.get()
+                if packed is None:
+                    break
+                f.write(packed)
+                self.written += 1
+                pending += 1
+                if pending >= self.flush_every or self.queue.empty():
+                    f.flush()
+                    pending = 0
+
+    def close(self):
+        if self._thread.is_alive():
+            self.queue.put(None)
+            self._thread.join()
+
+
+def read_binary_tick_log(path):
+    fields = ('symbol', 'ts_ms', 'best_bid_price_hyperliquid', 'best_ask_price_hyperliquid',
+              'best_bid_price_bybit', 'best_ask_price_bybit', 'entry_spread', 'exit_spread', 'timelag')
+    with open(path, 'rb') as f:
+        data = f.read()
+    for values in BinaryTickLog.record.iter_unpack(data[:len(data) - len(data) % BinaryTickLog.record.size]):
+        row = dict(zip(fields, values))
+        row['symbol'] = row['symbol'].rstrip(b'\0').decode()
+        yield row
+
+
+class TickDumper:
+    '''
+    Replaces the per-message print of every combined record: text dumps are sampled per
+    symbol and go through logging, and an optional binary log captures every tick compactly.
+    '''
+    def __init__(self, text_interval=1.0, binary_path=None):
+        self.sampler = TickSampler(text_interval) if text_interval is not None else None
+        self.binary = BinaryTickLog(binary_path) if binary_path else None
+
+    def dump(self, symbol, record, time_diff=None, ts_ms=None):
+        if self.binary is not None:
+            self.binary.write(symbol, ts_ms if ts_ms is not None else time.time() * 1000, record)
+        if self.sampler is not None and self.sampler.should_log(symbol):
+            if time_diff is None:
+                logging.info(f'{symbol} - {record}')
+            else:
+                logging.info(f'{time_diff:.2f}ms | {symbol} - {record}')
+
+
+if __name__ == "__main__":
+    # python telemetry.py ticks.bin -- dump a binary tick log as text
+    for row in read_binary_tick_log(sys.argv[1]):
+        print(row)
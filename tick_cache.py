@@ -0,0 +1,260 @@
+'''
+Local cache of the joined exchange_dataV2 / exchange_data_spot ticks, partitioned by day and
+coin, one .npy file per column:
+
+    root/day=2024-09-01/_manifest.json           {'complete': bool, 'rows': n, 'coins': [...]}
+    root/day=2024-09-01/coin=BTC%2FUSDT/timestamp.npy, hyperliquid_bid1.npy, ...
+
+A day is fetched from SQL once, with a timestamp range instead of TOP N, and marked complete
+once it ended more than `settle` ago; later loads only fetch days that are missing or were
+still incomplete. Reads memory-map just the requested columns of the partitions in range.
+
+    cache = TickCache('tick_cache', engine)
+    df = cache.load(datetime.now() - timedelta(days=3), datetime.now(), columns=['hyperliquid_bid1', 'bybit_ask1'])
+'''
+
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+from urllib.parse import quote
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+
+tick_columns = ['exchange_dataV2_id', 'exchange_data_spot_id', 'coin', 'timestamp',
+                'hyperliquid_bid1', 'hyperliquid_ask1', 'bybit_bid1', 'bybit_ask1']
+
+range_query = text("""
+SELECT
+    a.id, b.id, a.coin, a.timestamp,
+    a.hyperliquid_bid1, a.hyperliquid_ask1,
+    b.bybit_bid1, b.bybit_ask1
+FROM exchange_dataV2 a
+INNER JOIN exchange_data_spot b
+ON a.coin = b.coin AND a.timestamp = b.timestamp
+WHERE a.timestamp >= :start AND a.timestamp < :end
+""")
+
+price_columns = ['hyperliquid_bid1', 'hyperliquid_ask1', 'bybit_bid1', 'bybit_ask1']
+bar_columns = ['coin', 'timestamp', 'ticks'] + [f'{column}_{agg}' for column in price_columns
+                                                for agg in ('first', 'last', 'min', 'max')]
+
+
+def bar_bucket(dialect, minutes):
+    '''SQL expression for the start of the `minutes` bar holding a.timestamp, per dialect.'''
+    if dialect == 'mssql':
+        return f"DATEADD(minute, (DATEDIFF(minute, 0, a.timestamp) / {minutes}) * {minutes}, 0)"
+    if dialect == 'sqlite':
+        return f"datetime((CAST(strftime('%s', a.timestamp) AS INTEGER) / {minutes * 60}) * {minutes * 60}, 'unixepoch')"
+    if dialect == 'duckdb':
+        return f"time_bucket(INTERVAL '{minutes} minutes', a.timestamp)"
+    if dialect == 'postgresql':
+        return f"date_bin(INTERVAL '{minutes} minutes', a.timestamp, TIMESTAMP '2000-01-01')"
+    raise ValueError(f"No bar bucket expression for dialect {dialect}")
+
+
+def bar_query(dialect, minutes=1):
+    '''
+    Joined ticks with start <= timestamp < end aggregated on the server into `minutes` bars
+    per coin: tick count and first/last/min/max of every bid/ask, ordered by bar start.
+    '''
+    aggregates = []
+    for column in price_columns:
+        aggregates += [f"MAX(CASE WHEN rn_first = 1 THEN {column} END) AS {column}_first",
+                       f"MAX(CASE WHEN rn_last = 1 THEN {column} END) AS {column}_last",
+                       f"MIN({column}) AS {column}_min",
+                       f"MAX({column}) AS {column}_max"]
+    aggregates = ',\n    '.join(aggregates)
+    return text(f"""
+WITH ticks AS (
+    SELECT a.coin, {bar_bucket(dialect, minutes)} AS bar, a.timestamp,
+        a.hyperliquid_bid1, a.hyperliquid_ask1, b.bybit_bid1, b.bybit_ask1
+    FROM exchange_dataV2 a
+    INNER JOIN exchange_data_spot b
+    ON a.coin = b.coin AND a.timestamp = b.timestamp
+    WHERE a.timestamp >= :start AND a.timestamp < :end
+), ranked AS (
+    SELECT ticks.*,
+        ROW_NUMBER() OVER (PARTITION BY coin, bar ORDER BY timestamp) AS rn_first,
+        ROW_NUMBER() OVER (PARTITION BY coin, bar ORDER BY timestamp DESC) AS rn_last
+    FROM ticks
+)
+SELECT coin, bar, COUNT(*) AS ticks,
+    {aggregates}
+FROM ranked
+GROUP BY coin, bar
+ORDER BY bar, coin
+""")
+
+
+def read_bars(conn, start, end, minutes=1, chunk_size=50000):
+    '''bar_query for [start, end) streamed into columns, bar start in `timestamp`.'''
+    return read_columns(conn, bar_query(conn.dialect.name, minutes), bar_columns,
+                        {'start': start, 'end': end}, chunk_size=chunk_size)
+
+
+def column_dtype(name):
+    if name == 'coin':
+        return np.int32
+    if name == 'ticks':
+        return np.int64
+    if name == 'timestamp':
+        return 'datetime64[ns]'
+    if name.endswith('id'):
+        return np.int64
+    return np.float64
+
+
+def read_columns(conn, query, columns, params=None, chunk_size=50000, expected_rows=0):
+    '''
+    Streams a query into typed column arrays instead of fetchall() + DataFrame: rows come off
+    a server-side cursor chunk_size at a time and are copied straight into preallocated numpy
+    arrays ('coin' as categorical codes, 'timestamp' as datetime64[ns], '*id' as int64, the
+    rest float64), so besides the result columns only one chunk of Row objects is alive.
+    '''
+    result = conn.execution_options(stream_results=True).execute(query, params or {})
+    capacity = max(expected_rows, chunk_size)
+    arrays = {name: np.empty(capacity, dtype=column_dtype(name)) for name in columns}
+    coins = {}  # coin -> categorical code
+    size = 0
+    for rows in result.partitions(chunk_size):
+        end = size + len(rows)
+        if end > capacity:
+            capacity = max(end, capacity * 2)
+            for name, array in arrays.items():
+                grown = np.empty(capacity, dtype=array.dtype)
+                grown[:size] = array[:size]
+                arrays[name] = grown
+        for name, values in zip(columns, zip(*rows)):
+            if name == 'coin':
+                arrays[name][size:end] = [coins.setdefault(coin, len(coins)) for coin in values]
+            elif name == 'timestamp':
+                arrays[name][size:end] = np.asarray(pd.to_datetime(values), dtype='datetime64[ns]')
+            else:
+                arrays[name][size:end] = np.asarray(values, dtype=arrays[name].dtype)
+        size = end
+    data = {}
+    for name, array in arrays.items():
+        if name == 'coin':
+            data[name] = pd.Categorical.from_codes(array[:size], categories=list(coins))
+        else:
+            data[name] = array[:size]
+    return pd.DataFrame(data, columns=columns)
+
+
+class TickCache:
+    def __init__(self, root, engine=None, settle=timedelta(minutes=10), chunk_size=50000):
+        self.root = root
+        self.engine = engine  # SQLAlchemy engine for backfills, None for a read-only cache
+        self.settle = settle  # a day is complete once it ended this long ago
+        self.chunk_size = chunk_size
+        self.fetched_days = 0
+        self.fetched_rows = 0
+
+    def _day_path(self, day):
+        return os.path.join(self.root, f'day={day.isoformat()}')
+
+    def manifest(self, day):
+        try:
+            with open(os.path.join(self._day_path(day), '_manifest.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    @staticmethod
+    def days(start, end):
+        day = start.date()
+        while datetime.combine(day, datetime.min.time()) < end:
+            yield day
+            day += timedelta(days=1)
+
+    def missing_days(self, start, end):
+        return [day for day in self.days(start, end) if not (self.manifest(day) or {}).get('complete')]
+
+    def fetch_day(self, conn, day):
+        '''Replaces the day's partitions with a fresh pull of that day from SQL.'''
+        start = datetime.combine(day, datetime.min.time())
+        end = start + timedelta(days=1)
+        df = read_columns(conn, range_query, tick_columns, {'start': start, 'end': end}, chunk_size=self.chunk_size)
+        complete = end + self.settle <= datetime.now()
+        path = self._day_path(day)
+        staging = f'{path}.tmp'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        coins = []
+        for coin, rows in df.groupby('coin', observed=True, sort=False):
+            rows = rows.sort_values(['timestamp', 'exchange_dataV2_id'], kind='stable')
+            coin_path = os.path.join(staging, f'coin={quote(str(coin), safe="")}')
+            os.makedirs(coin_path)
+            for name in tick_columns:
+                if name != 'coin':
+                    np.save(os.path.join(coin_path, f'{name}.npy'), rows[name].to_numpy())
+            coins.append(str(coin))
+        with open(os.path.join(staging, '_manifest.json'), 'w') as f:
+            json.dump({'complete': complete, 'rows': len(df), 'coins': coins, 'fetched': datetime.now().isoformat()}, f)
+        # swap the whole day in, readers never see a half written partition set
+        if os.path.exists(path):
+            os.replace(path, f'{path}.old')
+        os.replace(staging, path)
+        shutil.rmtree(f'{path}.old', ignore_errors=True)
+        self.fetched_days += 1
+        self.fetched_rows += len(df)
+        return len(df)
+
+    def backfill(self, start, end):
+        '''Fetches every day in [start, end) that is not cached or was incomplete, returns those days.'''
+        missing = self.missing_days(start, end)
+        if missing:
+            with self.engine.connect() as conn:
+                for day in missing:
+                    rows = self.fetch_day(conn, day)
+                    print(f"Tick cache: fetched {day} ({rows} rows)")
+        return missing
+
+    def read(self, start, end, coins=None, columns=None):
+        '''
+        Cached ticks with start <= timestamp < end as a DataFrame (coin categorical, then
+        timestamp and `columns`, default all), ordered by day, coin, timestamp. Only the needed
+        column files are opened, memory mapped; nothing is fetched.
+        '''
+        columns = [name for name in (columns or tick_columns) if name not in ('coin', 'timestamp')]
+        wanted = None if coins is None else set(coins)
+        start64 = np.datetime64(pd.Timestamp(start).as_unit('ns'))
+        end64 = np.datetime64(pd.Timestamp(end).as_unit('ns'))
+        parts = []
+        names = []
+        for day in self.days(start, end):
+            manifest = self.manifest(day)
+            if manifest is None:
+                continue
+            for coin in manifest['coins']:
+                if wanted is not None and coin not in wanted:
+                    continue
+                coin_path = os.path.join(self._day_path(day), f'coin={quote(coin, safe="")}')
+                timestamps = np.load(os.path.join(coin_path, 'timestamp.npy'), mmap_mode='r')
+                lo, hi = np.searchsorted(timestamps, [start64, end64])
+                if lo == hi:
+                    continue
+                part = {'timestamp': timestamps[lo:hi]}
+                for name in columns:
+                    part[name] = np.load(os.path.join(coin_path, f'{name}.npy'), mmap_mode='r')[lo:hi]
+                parts.append(part)
+                names.append(coin)
+        categories = list(dict.fromkeys(names))
+        codes = {coin: code for code, coin in enumerate(categories)}
+        lengths = [len(part['timestamp']) for part in parts]
+        data = {'coin': pd.Categorical.from_codes(np.repeat([codes[coin] for coin in names], lengths).astype(np.int32),
+                                                  categories=categories)}
+        for name in ['timestamp'] + columns:
+            data[name] = (np.concatenate([part[name] for part in parts]) if parts
+                          else np.empty(0, dtype=column_dtype(name)))
+        return pd.DataFrame(data)
+
+    def load(self, start, end, coins=None, columns=None):
+        '''backfill() then read(): SQL is only hit for days not cached yet and the current day.'''
+        self.backfill(start, end)
+        return self.read(start, end, coins, columns)
+
+    def clear(self):
+        shutil.rmtree(self.root, ignore_errors=True)
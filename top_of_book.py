@@ -0,0 +1,232 @@
+'''
+Shared-memory top-of-book table for co-located readers. One writer (the collector) owns a
+memory-mapped file, normally under /dev/shm, with a fixed layout (little endian):
+
+    header   magic:8s version:u32 slot_count:u32 slot_size:u32 pad (64 bytes)
+    slots    slot_count x slot_size bytes:
+             seq:u64 symbol:16s timestamp_ms:i64 time_hyperliquid:i64 time_bybit:i64
+             best bid/ask hyperliquid, best bid/ask bybit,
+             impact bid/ask hyperliquid, impact bid/ask bybit,
+             entry_spread, exit_spread, impact_entry_spread, impact_exit_spread  (12 x f64)
+             updates:u64, padded to 192 bytes
+
+Slots are handed out on a symbol's first publish and zeroed (empty symbol) when it is removed,
+then reused; readers skip empty slots.
+
+Each slot is a seqlock: the writer makes seq odd, writes the body, then makes it even again.
+A reader unpacks straight out of the mapping and retries if seq was odd or changed under it,
+so it never sees a torn row and never blocks the writer. After max_retries it raises
+SlotBusyError rather than spin forever on a slot a dead writer left odd. Impact values are
+for the smallest notional of the ladder; missing values are NaN, missing times MISSING_INT.
+'''
+
+import logging
+import math
+import mmap
+import os
+import struct
+import time
+
+MAGIC = b'FLXTOB01'
+TABLE_VERSION = 1
+HEADER = struct.Struct('<8sIII')
+HEADER_SIZE = 64
+SEQ = struct.Struct('<Q')
+BODY = struct.Struct('<16sqqq12dQ')
+SLOT_SIZE = 192
+FIELDS = ('symbol', 'timestamp_ms', 'time_hyperliquid', 'time_bybit',
+          'best_bid_price_hyperliquid', 'best_ask_price_hyperliquid', 'best_bid_price_bybit', 'best_ask_price_bybit',
+          'impact_bid_price_hyperliquid', 'impact_ask_price_hyperliquid', 'impact_bid_price_bybit', 'impact_ask_price_bybit',
+          'entry_spread', 'exit_spread', 'impact_entry_spread', 'impact_exit_spread', 'updates')
+NAN = float('nan')
+MISSING_INT = -2 ** 63
+
+
+class SlotBusyError(Exception):
+    pass
+
+
+def _f(value):
+    return NAN if value is None else float(value)
+
+
+def _i(value):
+    return MISSING_INT if value is None else int(value)
+
+
+class TopOfBookWriter:
+    '''
+    Owns the table, only one writer process per file. Symbols get a slot on first publish and
+    give it back with remove(). When every slot is taken, write() logs once per symbol and
+    skips it instead of raising into process_data.
+    '''
+    def __init__(self, path, slot_count=256):
+        self.path = path
+        self.slot_count = slot_count
+        size = HEADER_SIZE + slot_count * SLOT_SIZE
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            # never shrink: a reader still mapping a larger table would fault
+            if os.fstat(fd).st_size < size:
+                os.ftruncate(fd, size)
+            self.mm = mmap.mmap(fd, size, mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+        finally:
+            os.close(fd)
+        # a restarted writer starts from an empty table, readers re-resolve their slots
+        self.mm[:] = bytes(size)
+        HEADER.pack_into(self.mm, 0, MAGIC, TABLE_VERSION, slot_count, SLOT_SIZE)
+        self.slots = {}  # symbol -> [offset, seq, updates]
+        self.free = []  # [offset, seq] of removed symbols' slots, reused before fresh ones
+        self.allocated = 0  # slots handed out so far, readers stop scanning at the first unused one
+        self.refused = set()  # symbols without a slot, logged once each
+
+    def _slot(self, symbol):
+        if self.free:
+            offset, seq = self.free.pop()
+        elif self.allocated < self.slot_count:
+            offset, seq = HEADER_SIZE + self.allocated * SLOT_SIZE, 0
+            self.allocated += 1
+        else:
+            return None
+        slot = self.slots[symbol] = [offset, seq, 0]
+        return slot
+
+    def write(self, symbol, timestamp_ms, time_hyperliquid, time_bybit, *values):
+        slot = self.slots.get(symbol) or self._slot(symbol)
+        if slot is None:
+            if symbol not in self.refused:
+                self.refused.add(symbol)
+                logging.warning(f"Top-of-book table {self.path} is full ({self.slot_count} slots), {symbol} is not published")
+            return False
+        offset = slot[0]
+        slot[1] += 1
+        SEQ.pack_into(self.mm, offset, slot[1])  # odd: write in progress
+        slot[2] += 1
+        BODY.pack_into(self.mm, offset + SEQ.size, symbol.encode()[:16], timestamp_ms, time_hyperliquid, time_bybit, *values, slot[2])
+        slot[1] += 1
+        SEQ.pack_into(self.mm, offset, slot[1])
+        return True
+
+    def remove(self, symbol):
+        '''Clears the symbol's slot (readers see an empty row) and frees it for the next symbol.'''
+        self.refused.discard(symbol)
+        slot = self.slots.pop(symbol, None)
+        if slot is None:
+            return
+        offset = slot[0]
+        slot[1] += 1
+        SEQ.pack_into(self.mm, offset, slot[1])
+        self.mm[offset + SEQ.size:offset + SLOT_SIZE] = bytes(SLOT_SIZE - SEQ.size)
+        slot[1] += 1
+        SEQ.pack_into(self.mm, offset, slot[1])
+        self.free.append([offset, slot[1]])
+
+    def publish(self, symbol, record):
+        # record is process_data's combined_data_impact, False when the table is full
+        ladder = record.get('impact_ladder') or {}
+        smallest = ladder[min(ladder)] if ladder else {}
+        return self.write(symbol, _i(record.get('timestamp_ms')),
+                   _i((record.get('hyperliquid_orderbook') or {}).get('time')), _i((record.get('bybit_orderbook') or {}).get('time')),
+                   _f(record.get('best_bid_price_hyperliquid')), _f(record.get('best_ask_price_hyperliquid')),
+                   _f(record.get('best_bid_price_bybit')), _f(record.get('best_ask_price_bybit')),
+                   _f(smallest.get('impact_bid_price_hyperliquid')), _f(smallest.get('impact_ask_price_hyperliquid')),
+                   _f(smallest.get('impact_bid_price_bybit')), _f(smallest.get('impact_ask_price_bybit')),
+                   _f(record.get('entry_spread')), _f(record.get('exit_spread')),
+                   _f(smallest.get('entry_spread')), _f(smallest.get('exit_spread')))
+
+    def close(self):
+        self.mm.close()
+
+
+class TopOfBookReader:
+    '''
+    Read-only view of a table written by TopOfBookWriter, for any local process:
+
+        reader = TopOfBookReader('/dev/shm/felix_top_of_book')
+        row = reader.read('BTC')   # dict of FIELDS, None if the symbol has no slot
+
+    A slot that stays mid-write for max_retries reads raises SlotBusyError.
+    '''
+    def __init__(self, path, max_retries=100000):
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            self.mm = mmap.mmap(fd, 0, mmap.MAP_SHARED, mmap.PROT_READ)
+        finally:
+            os.close(fd)
+        magic, version, self.slot_count, self.slot_size = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != TABLE_VERSION:
+            raise ValueError(f"{path} is not a version {TABLE_VERSION} top-of-book table")
+        self.offsets = {}  # symbol -> slot offset, rebuilt when a symbol is not where it was
+        self.max_retries = max_retries  # a write holds the slot for about a microsecond
+        self.retries = 0
+
+    def _refresh(self):
+        # every slot handed out so far: removed symbols leave empty slots that others reuse
+        self.offsets = {}
+        for i in range(self.slot_count):
+            offset = HEADER_SIZE + i * self.slot_size
+            row = self.read_slot(offset)
+            if row is None:
+                break
+            if row[0]:
+                self.offsets[row[0]] = offset
+
+    def read_slot(self, offset):
+        '''Consistent tuple in FIELDS order (symbol decoded, '' once freed), None for a slot never written.'''
+        mm = self.mm
+        for _ in range(self.max_retries + 1):
+            seq = SEQ.unpack_from(mm, offset)[0]
+            if seq == 0:
+                return None
+            if seq & 1:
+                self.retries += 1
+                continue
+            body = BODY.unpack_from(mm, offset + SEQ.size)
+            if SEQ.unpack_from(mm, offset)[0] == seq:
+                return (body[0].rstrip(b'\0').decode(),) + body[1:]
+            self.retries += 1
+        raise SlotBusyError(f"Slot at offset {offset} still being written (seq {seq}) after {self.max_retries} retries, is the writer alive?")
+
+    def symbols(self):
+        self._refresh()
+        return list(self.offsets)
+
+    def read(self, symbol):
+        offset = self.offsets.get(symbol)
+        row = self.read_slot(offset) if offset is not None else None
+        if row is None or row[0] != symbol:
+            # new or removed symbol, or the writer restarted and slots moved
+            self._refresh()
+            offset = self.offsets.get(symbol)
+            row = self.read_slot(offset) if offset is not None else None
+        return dict(zip(FIELDS, row)) if row is not None else None
+
+    def read_all(self):
+        self._refresh()
+        rows = {}
+        for offset in self.offsets.values():
+            row = self.read_slot(offset)
+            if row is not None and row[0]:
+                rows[row[0]] = dict(zip(FIELDS, row))
+        return rows
+
+    def close(self):
+        self.mm.close()
+
+
+if __name__ == "__main__":
+    # python top_of_book.py /dev/shm/felix_top_of_book [interval]
+    import sys
+    reader = TopOfBookReader(sys.argv[1])
+    interval = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    while True:
+        start = time.perf_counter_ns()
+        rows = reader.read_all()
+        elapsed_us = (time.perf_counter_ns() - start) / 1000
+        for symbol, row in rows.items():
+            age_ms = time.time() * 1000 - row['timestamp_ms'] if row['timestamp_ms'] != MISSING_INT else math.nan
+            print(f"{symbol:>10} hl {row['best_bid_price_hyperliquid']}/{row['best_ask_price_hyperliquid']} "
+                  f"bybit {row['best_bid_price_bybit']}/{row['best_ask_price_bybit']} "
+                  f"entry {row['entry_spread']} exit {row['exit_spread']} age {age_ms:.1f}ms updates {row['updates']}")
+        print(f"read {len(rows)} rows in {elapsed_us:.1f}us, {reader.retries} seqlock retries")
+        time.sleep(interval)
@@ -0,0 +1,316 @@
+import copy
+import json
+import math
+import os
+import time
+from collections import deque
+import numpy as np
+import pandas as pd
+
+NAN = float('nan')
+
+
+class RollingStats:
+    '''
+    Mean and sample standard deviation of the last `window` values, updated in O(1) with
+    Welford add/remove. NaN until the window is full, like pandas rolling(window).
+    The running sums are rebuilt from the window every `resync` updates so removal error
+    cannot accumulate.
+    '''
+    def __init__(self, window, resync=10000):
+        self.window = window
+        self.resync = resync
+        self.values = deque(maxlen=window)
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.updates = 0
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            old = self.values[0]
+            n = len(self.values) - 1
+            if n:
+                delta = old - self.mean
+                self.mean -= delta / n
+                self.m2 -= delta * (old - self.mean)
+            else:
+                self.mean = self.m2 = 0.0
+        self.values.append(x)
+        n = len(self.values)
+        delta = x - self.mean
+        self.mean += delta / n
+        self.m2 += delta * (x - self.mean)
+        self.updates += 1
+        if self.updates % self.resync == 0:
+            self._recompute()
+
+    def _recompute(self):
+        values = np.fromiter(self.values, dtype=np.float64)
+        self.mean = float(values.mean())
+        self.m2 = float(((values - self.mean) ** 2).sum())
+
+    def ma(self):
+        return self.mean if len(self.values) == self.window else NAN
+
+    def sd(self):
+        if len(self.values) < self.window or self.window < 2:
+            return NAN
+        return math.sqrt(max(self.m2, 0.0) / (self.window - 1))
+
+    def state(self):
+        return {'values': list(self.values), 'updates': self.updates}
+
+    def restore(self, state):
+        self.values = deque(state['values'], maxlen=self.window)
+        self.updates = state['updates']
+        if self.values:
+            self._recompute()
+
+
+class EwmStats:
+    '''
+    Exponentially weighted mean and unbiased variance with span, identical recurrence to
+    pandas ewm(span=span, adjust=False).mean() / .var() (bias=False) on a series without NaNs.
+    '''
+    def __init__(self, span):
+        self.span = span
+        self.alpha = 2.0 / (span + 1.0)
+        self.nobs = 0
+        self.mean = NAN
+        self.cov = 0.0
+        self.sum_wt = 1.0
+        self.sum_wt2 = 1.0
+        self.old_wt = 1.0
+
+    def update(self, x):
+        self.nobs += 1
+        if self.nobs == 1:
+            self.mean = x
+            return
+        factor = 1.0 - self.alpha
+        new_wt = self.alpha
+        self.sum_wt *= factor
+        self.sum_wt2 *= factor * factor
+        self.old_wt *= factor
+        old_mean = self.mean
+        if self.mean != x:
+            self.mean = (self.old_wt * old_mean + new_wt * x) / (self.old_wt + new_wt)
+        self.cov = (self.old_wt * (self.cov + (old_mean - self.mean) ** 2) + new_wt * (x - self.mean) ** 2) / (self.old_wt + new_wt)
+        self.sum_wt += new_wt
+        self.sum_wt2 += new_wt * new_wt
+        self.old_wt += new_wt
+        self.sum_wt /= self.old_wt
+        self.sum_wt2 /= self.old_wt * self.old_wt
+        self.old_wt = 1.0
+
+    def var(self):
+        numerator = self.sum_wt * self.sum_wt
+        denominator = numerator - self.sum_wt2
+        return numerator / denominator * self.cov if self.nobs and denominator > 0 else NAN
+
+    def sd(self):
+        return math.sqrt(self.var())
+
+    def state(self):
+        return [self.nobs, self.mean, self.cov, self.sum_wt, self.sum_wt2]
+
+    def restore(self, state):
+        self.nobs, self.mean, self.cov, self.sum_wt, self.sum_wt2 = state
+
+
+class CoinStats:
+    '''The per-coin state behind one row of calculate_ma_range, for the sell and buy spread.'''
+    columns = ('sell_spread', 'buy_spread')
+
+    def __init__(self, window_m, window_l):
+        self.last_timestamp = None
+        self.current = {column: NAN for column in self.columns}
+        self.ma_m = {column: RollingStats(window_m) for column in self.columns}
+        self.ewm_m = {column: EwmStats(window_m) for column in self.columns}
+        self.rolling_l = {column: RollingStats(window_l) for column in self.columns}
+
+    def update(self, timestamp, sell_spread, buy_spread):
+        for column, value in zip(self.columns, (sell_spread, buy_spread)):
+            self.current[column] = value
+            self.ma_m[column].update(value)
+            self.ewm_m[column].update(value)
+            self.rolling_l[column].update(value)
+        self.last_timestamp = timestamp
+
+    def row(self):
+        return {
+            'sell_spread_ma_M': self.ma_m['sell_spread'].ma(),
+            'buy_spread_ma_M': self.ma_m['buy_spread'].ma(),
+            'sell_spread_sd_M': self.ewm_m['sell_spread'].sd(),
+            'buy_spread_sd_M': self.ewm_m['buy_spread'].sd(),
+            'sell_spread_ma_L': self.rolling_l['sell_spread'].ma(),
+            'buy_spread_ma_L': self.rolling_l['buy_spread'].ma(),
+            'sell_spread_sd_L': self.rolling_l['sell_spread'].sd(),
+            'buy_spread_sd_L': self.rolling_l['buy_spread'].sd(),
+            'current_sell_spread': self.current['sell_spread'],
+            'current_buy_spread': self.current['buy_spread'],
+        }
+
+    def state(self):
+        return {
+            'last_timestamp': self.last_timestamp,
+            'current': self.current,
+            'ma_m': {column: stats.state() for column, stats in self.ma_m.items()},
+            'ewm_m': {column: stats.state() for column, stats in self.ewm_m.items()},
+            'rolling_l': {column: stats.state() for column, stats in self.rolling_l.items()},
+        }
+
+    def restore(self, state):
+        self.last_timestamp = state['last_timestamp']
+        self.current = state['current']
+        for name in ('ma_m', 'ewm_m', 'rolling_l'):
+            for column, stats in getattr(self, name).items():
+                stats.restore(state[name][column])
+
+
+class TrendStatsEngine:
+    '''
+    Online replacement for TrendsRedisUpload.calculate_ma_range: per coin, the rolling
+    window_m mean, the EWM(span=window_m, adjust=False) standard deviation, and the rolling
+    window_l mean/std of the sell and buy spread, updated once per new row. update(df) only
+    consumes rows newer than the last timestamp seen for each coin, so a cycle costs the new
+    rows, not the two-week history. The EWM starts at the first row the engine saw rather
+    than at the start of the current window; after a few times window_m rows the difference
+    is below float precision. Rows within `settle` of the newest timestamp are not consumed
+    yet, a partner that joins late can still land before them; summary() applies them to a
+    copy of the state, so the current values stay fresh. save()/load() snapshot the settled
+    state to JSON for warm restarts, a snapshot older than max_age seconds is ignored.
+    '''
+    snapshot_version = 2
+
+    def __init__(self, window_m=144, window_l=15, snapshot_path=None, settle=None, max_age=3600, source='ticks'):
+        self.window_m = window_m
+        self.window_l = window_l
+        self.source = source  # what a row is, e.g. 'ticks' or 'bars5'; a snapshot of another source is not restored
+        self.snapshot_path = snapshot_path
+        self.settle = settle  # timedelta, None consumes every row at once
+        self.max_age = max_age
+        self.coins = {}  # coin -> CoinStats
+        self.tail = None  # rows not settled yet, sorted by coin and timestamp
+        self.rows = 0
+
+    def update(self, df):
+        '''df has coin, sell_spread, buy_spread and a timestamp column or index, any order.'''
+        timestamps = df['timestamp'] if 'timestamp' in df.columns else df.index.to_series()
+        new = pd.DataFrame({
+            'coin': np.asarray(df['coin'], dtype=object),
+            'timestamp': np.asarray(timestamps, dtype='datetime64[ns]').view(np.int64),
+            'sell_spread': np.asarray(df['sell_spread'], dtype=np.float64),
+            'buy_spread': np.asarray(df['buy_spread'], dtype=np.float64),
+        }).dropna()
+        newest = new['timestamp'].max() if len(new) else None
+        seen = new['coin'].map({coin: stats.last_timestamp for coin, stats in self.coins.items()})
+        new = new[seen.isna() | (new['timestamp'] > seen)]
+        new = new.sort_values(['coin', 'timestamp'], kind='stable')
+        if self.settle is not None and newest is not None:
+            settled = new['timestamp'] <= newest - pd.Timedelta(self.settle).value
+            self.tail = new[~settled]
+            new = new[settled]
+        for coin, timestamp, sell_spread, buy_spread in zip(new['coin'].tolist(), new['timestamp'].tolist(),
+                                                            new['sell_spread'].tolist(), new['buy_spread'].tolist()):
+            stats = self.coins.get(coin)
+            if stats is None:
+                stats = self.coins[coin] = CoinStats(self.window_m, self.window_l)
+            stats.update(timestamp, sell_spread, buy_spread)
+        self.rows += len(new)
+        return len(new)
+
+    def _provisional(self):
+        # the unsettled rows applied to copies, the settled state is untouched
+        provisional = {}
+        if self.tail is None:
+            return provisional
+        tail = self.tail
+        for coin, timestamp, sell_spread, buy_spread in zip(tail['coin'].tolist(), tail['timestamp'].tolist(),
+                                                            tail['sell_spread'].tolist(), tail['buy_spread'].tolist()):
+            stats = provisional.get(coin)
+            if stats is None:
+                settled = self.coins.get(coin)
+                stats = provisional[coin] = copy.deepcopy(settled) if settled is not None else CoinStats(self.window_m, self.window_l)
+            stats.update(timestamp, sell_spread, buy_spread)
+        return provisional
+
+    def summary(self, coins=None):
+        current = {**self.coins, **self._provisional()}
+        coins = current if coins is None else [coin for coin in coins if coin in current]
+        return pd.DataFrame([{'coin': coin, **current[coin].row()} for coin in coins])
+
+    def save(self, path=None):
+        path = path or self.snapshot_path
+        state = {
+            'version': self.snapshot_version,
+            'window_m': self.window_m,
+            'window_l': self.window_l,
+            'source': self.source,
+            'saved': time.time(),
+            'coins': {coin: stats.state() for coin, stats in self.coins.items()},
+        }
+        with open(f'{path}.tmp', 'w') as f:
+            json.dump(state, f)
+        os.replace(f'{path}.tmp', path)
+
+    def load(self, path=None):
+        '''Restores a snapshot of the same windows and source within max_age, returns False if there is none to use.'''
+        path = path or self.snapshot_path
+        if not path or not os.path.exists(path):
+            return False
+        with open(path) as f:
+            state = json.load(f)
+        if ((state.get('version'), state.get('window_m'), state.get('window_l'), state.get('source'))
+                != (self.snapshot_version, self.window_m, self.window_l, self.source)):
+            return False
+        if time.time() - state['saved'] > self.max_age:
+            # the rolling windows would span the downtime
+            return False
+        self.coins = {}
+        for coin, coin_state in state['coins'].items():
+            stats = self.coins[coin] = CoinStats(self.window_m, self.window_l)
+            stats.restore(coin_state)
+        return True
+
+
+def window_signals(df, windows=(15, 144, 1440, '1h', '4h', '24h'), columns=('sell_spread', 'buy_spread')):
+    '''
+    Per coin, for every window and column: mean, sample std, z-score of the current (latest)
+    value against them, and its percentile (share of the window's values <= current, 0-100).
+    An int window is the last N rows of the coin (NaN until it has N, like rolling), a string
+    like '4h' is every row within that time of the coin's latest timestamp. Each window is one
+    vectorized groupby over all coins. Columns are named {column}_{ma|sd|z|pct}_{window}.
+    '''
+    timestamps = df['timestamp'] if 'timestamp' in df.columns else df.index.to_series()
+    data = pd.DataFrame({'coin': np.asarray(df['coin'], dtype=object),
+                         'timestamp': np.asarray(timestamps, dtype='datetime64[ns]')})
+    for column in columns:
+        data[column] = np.asarray(df[column], dtype=np.float64)
+    data = data.dropna().sort_values(['coin', 'timestamp'], kind='stable', ignore_index=True)
+    grouped = data.groupby('coin', sort=False)
+    from_end = grouped.cumcount(ascending=False).to_numpy()
+    age = (grouped['timestamp'].transform('max') - data['timestamp']).to_numpy()
+    current = grouped[list(columns)].transform('last')
+    latest = grouped[list(columns)].last()
+    signals = pd.DataFrame(index=pd.Index(data['coin'].unique(), name='coin'))
+    for window in windows:
+        if isinstance(window, int):
+            mask = from_end < window
+        else:
+            mask = age <= pd.Timedelta(window).to_timedelta64()
+        rows = data[mask]
+        stats = rows.groupby('coin', sort=False)[list(columns)].agg(['mean', 'std', 'count'])
+        below = (rows[list(columns)] <= current[mask]).groupby(rows['coin'], sort=False).mean()
+        for column in columns:
+            ma = stats[(column, 'mean')]
+            sd = stats[(column, 'std')]
+            if isinstance(window, int):
+                full = stats[(column, 'count')] >= window
+                ma, sd = ma.where(full), sd.where(full)
+            label = str(window)
+            signals[f'{column}_ma_{label}'] = ma
+            signals[f'{column}_sd_{label}'] = sd
+            signals[f'{column}_z_{label}'] = (latest[column] - ma) / sd.where(sd > 0)
+            signals[f'{column}_pct_{label}'] = 100 * below[column].where(ma.notna())
+    return signals.reset_index()
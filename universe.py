@@ -0,0 +1,90 @@
+import asyncio
+import logging
+from market_metadata import metadata_client
+
+
+async def fetch_hyperliquid_coins():
+    # perp coins listed on hyperliquid, from the metaAndAssetCtxs call TrendsRedisUpload shares
+    return await metadata_client.hyperliquid_coins()
+
+
+async def fetch_bybit_linear_coins():
+    # base coins of trading USDT linear perpetuals
+    return await metadata_client.bybit_linear_coins()
+
+
+class UniverseManager:
+    '''
+    Keeps the collector's symbol set equal to the coins listed on both Hyperliquid and Bybit
+    linear. Every refresh_interval it fetches both listings (async fetch_hyperliquid /
+    fetch_bybit, by default through the shared MetadataClient) and calls the async
+    on_add(symbols) / on_remove(symbols) with the difference. A coin is only removed after it
+    has been missing from remove_after consecutive refreshes, and a failed fetch changes
+    nothing, so a flaky listing call never tears down warm books.
+    '''
+    def __init__(self, on_add, on_remove, symbols=(), refresh_interval=300, include=(), exclude=(), max_symbols=None,
+                 remove_after=2, fetch_hyperliquid=fetch_hyperliquid_coins, fetch_bybit=fetch_bybit_linear_coins):
+        self.on_add = on_add
+        self.on_remove = on_remove
+        self.symbols = set(symbols)
+        self.refresh_interval = refresh_interval
+        self.include = set(include)  # always tracked, listed or not
+        self.exclude = set(exclude)
+        self.max_symbols = max_symbols
+        self.remove_after = remove_after
+        self.fetch_hyperliquid = fetch_hyperliquid
+        self.fetch_bybit = fetch_bybit
+        self.missing = {}  # symbol -> consecutive refreshes it was not listed
+        self.refreshes = 0
+        self.errors = 0
+
+    async def listed(self):
+        hyperliquid, bybit = await asyncio.gather(self.fetch_hyperliquid(), self.fetch_bybit())
+        return (hyperliquid & bybit) - self.exclude
+
+    async def refresh(self):
+        try:
+            listed = await self.listed()
+        except Exception as e:
+            self.errors += 1
+            logging.error(f"Symbol universe refresh failed, keeping {len(self.symbols)} symbols: {e}")
+            return
+        self.refreshes += 1
+        listed |= self.include
+        removed = []
+        for symbol in self.symbols - listed:
+            self.missing[symbol] = self.missing.get(symbol, 0) + 1
+            if self.missing[symbol] >= self.remove_after:
+                removed.append(symbol)
+        for symbol in listed:
+            self.missing.pop(symbol, None)
+        if removed:
+            logging.info(f"Symbol universe: removing {sorted(removed)}")
+            self.symbols.difference_update(removed)
+            for symbol in removed:
+                self.missing.pop(symbol, None)
+            await self.on_remove(sorted(removed))
+        added = sorted(listed - self.symbols)
+        if self.max_symbols is not None:
+            added = added[:max(0, self.max_symbols - len(self.symbols))]
+        if added:
+            logging.info(f"Symbol universe: adding {added}")
+            self.symbols.update(added)
+            await self.on_add(added)
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.errors += 1
+                logging.error(f"Symbol universe update failed: {e}")
+
+    def stats(self):
+        return {
+            'symbols': len(self.symbols),
+            'pending_removal': len(self.missing),
+            'refreshes': self.refreshes,
+            'errors': self.errors,
+        }